@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+"""Benchmarks for every capacity code path
+
+Times single-scenario latency, N-scenario throughput, import time and peak memory of
+each implementation of the cumulative confidence curve, checks that they all agree
+with the original lognorm.ppf loop and that the Gaussian-copula Monte Carlo reproduces the
+closed-form correlation option, and saves the results as JSON so runs on different
+commits can be compared.
+
+Run from the repository root:
+    python benchmarks/bench_capacity.py                      # writes benchmarks/results/<commit>.json
+    python benchmarks/bench_capacity.py --scales 10 1000 --profile
+    python benchmarks/bench_capacity.py compare old.json new.json
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import argparse
+import ast
+import cProfile
+import json
+import platform
+import pstats
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, lognorm
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'power_user_class'))
+
+import power_backends
+import power_dens
+import power_montecarlo
+import confidence_Class
+
+STREAMLIT_APP = ROOT / 'streamlit' / 'Power-Density_streamlit.py'
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+# maximum relative difference to the reference allowed for any path
+TOLERANCE = 1e-9
+
+# Gaussian-copula Monte Carlo against the closed-form correlation option: maximum relative
+# difference between 5% and 95% confidence, allowing for sampling error of 10**6 samples
+MC_TOLERANCE = 0.02
+MC_CORRELATIONS = (-0.6, 0., 0.5, 0.9)
+
+# power_dens may take this much longer to import than NumPy alone, and must not load these
+IMPORT_BUDGET_S = 0.05
+HEAVY_MODULES = ('pandas', 'scipy', 'matplotlib')
+
+
+def reference_cumulative_conf(areaP90, areaP10, pdP90, pdP10):
+    """The original implementation: one lognorm.ppf call per grid point"""
+    area_mu = ((np.log(areaP90)+np.log(areaP10))/2)
+    area_sigma = (np.log(areaP10)-np.log(areaP90))/((norm.ppf(0.9)-(norm.ppf(0.1))))
+    powerdens_mu = ((np.log(pdP90)+np.log(pdP10))/2)
+    powerdens_sigma = (np.log(pdP10)-np.log(pdP90))/((norm.ppf(0.9)-(norm.ppf(0.1))))
+    capacity_mu = area_mu + powerdens_mu
+    capacity_sigma = ((area_sigma**2)+(powerdens_sigma**2))**0.5
+    return np.array([lognorm.ppf(x/100, capacity_sigma, loc=0, scale=np.exp(capacity_mu)) for x in range(0,100)])
+
+
+def load_streamlit_function():
+    """Pull calculate_cumulative_conf out of the Streamlit app without running the app"""
+    source = STREAMLIT_APP.read_text(encoding='utf-8')
+    module = ast.parse(source)
+    namespace = {'np': np, 'pd': pd, 'norm': norm, 'lognorm': lognorm, 'power_dens': power_dens}
+    for node in module.body:
+        if isinstance(node, ast.FunctionDef) and node.name == 'calculate_cumulative_conf':
+            exec(compile(ast.Module([node], type_ignores=[]), str(STREAMLIT_APP), 'exec'), namespace)
+            return namespace['calculate_cumulative_conf']
+    raise RuntimeError("calculate_cumulative_conf not found in the Streamlit app")
+
+
+def scenarios(n, seed=0):
+    """Reproducible P90/P10 inputs"""
+    rng = np.random.default_rng(seed)
+    areaP90 = rng.uniform(0.5, 5, n)
+    pdP90 = rng.uniform(2, 12, n)
+    return areaP90, areaP90 * rng.uniform(1.5, 8, n), pdP90, pdP90 * rng.uniform(1.2, 4, n)
+
+
+def single_paths():
+    """Single-scenario implementations, each returning the 100 capacities of the curve"""
+    streamlit_conf = load_streamlit_function()
+    user = confidence_Class.prospect_confidence()
+
+    return {
+        'power_dens.calculate_cumulative_conf':
+            lambda a90, a10, p90, p10: power_dens.calculate_cumulative_conf(a90, a10, p90, p10).iloc[:, 1].to_numpy(),
+        'prospect_confidence.calculate_cumulative_conf':
+            lambda a90, a10, p90, p10: user.calculate_cumulative_conf(a90, a10, p90, p10).iloc[:, 0].to_numpy(),
+        'streamlit.calculate_cumulative_conf':
+            lambda a90, a10, p90, p10: streamlit_conf(a90, a10, p90, p10).iloc[:, 1].to_numpy(),
+        'power_dens.calculate_cumulative_conf_batch':
+            lambda a90, a10, p90, p10: power_dens.calculate_cumulative_conf_batch(a90, a10, p90, p10)[0],
+    }
+
+
+def batch_paths():
+    """N-scenario implementations, each returning an (N, 100) matrix"""
+    user = confidence_Class.prospect_confidence()
+
+    return {
+        'prospect_confidence.add_scenarios':
+            lambda *inputs: user.add_scenarios(*inputs).to_numpy().T,
+        'power_dens.calculate_cumulative_conf_batch':
+            lambda *inputs: power_dens.calculate_cumulative_conf_batch(*inputs),
+        'power_dens.calculate_cumulative_conf (loop)':
+            lambda *inputs: np.array([power_dens.calculate_cumulative_conf(*row).iloc[:, 1].to_numpy()
+                                      for row in zip(*inputs)]),
+    }
+
+
+def relative_error(values, reference):
+    """Largest relative difference, ignoring the zero at the 100% confidence point"""
+    values, reference = np.asarray(values, dtype=float), np.asarray(reference, dtype=float)
+    nonzero = reference != 0
+    if np.any(values[~nonzero] != 0):
+        return np.inf
+    return float(np.max(np.abs(values[nonzero] / reference[nonzero] - 1), initial=0.))
+
+
+def time_call(function, repeat=5, min_time=0.2):
+    """Best and median seconds per call, auto-scaling the number of calls per repeat"""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    times = np.array(timer.repeat(repeat=repeat, number=number)) / number
+    return {'best_s': float(times.min()), 'median_s': float(np.median(times)), 'calls': number}
+
+
+def peak_memory(function):
+    """Peak traced Python allocation of one call, in bytes"""
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def import_time(module, repeat=5):
+    """Cold import time of a module in a fresh interpreter, best of repeat
+
+    Returns:
+        seconds (float): best import time
+        heavy (list): heavy optional libraries the import pulled in
+    """
+    code = (f"import sys, time; sys.path[:0] = [{str(ROOT)!r}, {str(ROOT / 'power_user_class')!r}]; "
+            f"t = time.perf_counter(); import {module}; print(time.perf_counter() - t); "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    runs = [subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                           check=True).stdout.split('\n') for _ in range(repeat)]
+    return min(float(run[0]) for run in runs), [m for m in runs[0][1].split(',') if m]
+
+
+def check_import_budget(import_s, heavy):
+    """Problems with the start-up cost of the NumPy-only core, as messages"""
+    problems = []
+    if heavy['power_dens']:
+        problems.append(f"importing power_dens loads {', '.join(heavy['power_dens'])}")
+    budget = import_s['numpy'] + IMPORT_BUDGET_S
+    if import_s['power_dens'] > budget:
+        problems.append(f"importing power_dens took {import_s['power_dens']:.3f} s, budget {budget:.3f} s")
+    return problems
+
+
+def check_agreement(n=200):
+    """Compare every path against the reference on random scenarios"""
+    inputs = scenarios(n, seed=1)
+    reference = np.array([reference_cumulative_conf(*row) for row in zip(*inputs)])
+
+    errors = {}
+    for name, path in single_paths().items():
+        errors[name] = max(relative_error(path(*row), reference[i])
+                           for i, row in enumerate(zip(*(x.tolist() for x in inputs))))
+    for name, path in batch_paths().items():
+        errors[name + ' [batch]'] = relative_error(path(*inputs), reference)
+
+    # every compute backend must give the same answer, not just one within tolerance
+    numpy_values = power_dens.calculate_cumulative_conf_batch(*inputs, backend='numpy')
+    for name in power_backends.available_backends():
+        values = power_dens.calculate_cumulative_conf_batch(*inputs, backend=name)
+        errors[f'power_backends.{name} [batch]'] = relative_error(values, reference)
+        if not np.array_equal(values, numpy_values):
+            errors[f'power_backends.{name} [batch]'] = np.inf
+    power_backends.BACKENDS['process'].close()
+
+    return errors
+
+
+def check_monte_carlo(n=3, n_samples=10**6):
+    """Compare the correlated Monte Carlo sampler with the closed form on random scenarios"""
+    errors = {}
+    for correlation in MC_CORRELATIONS:
+        error = 0.
+        for i, row in enumerate(zip(*(x.tolist() for x in scenarios(n, seed=2)))):
+            sampled = power_montecarlo.monte_carlo_cumulative_conf(*row, n_samples=n_samples, seed=i,
+                                                                   correlation=correlation)
+            closed = power_dens.calculate_cumulative_conf(*row, correlation=correlation)
+            error = max(error, relative_error(sampled.iloc[5:96, 1], closed.iloc[5:96, 1]))
+        errors[f'correlation {correlation:+.1f}'] = error
+    return errors
+
+
+def run(scales, profile_dir=None):
+    """Run every benchmark and return the results as a dictionary"""
+    results = {'single': {}, 'batch': {}, 'import_s': {}, 'agreement': {}}
+
+    a90, a10, p90, p10 = (float(x[0]) for x in scenarios(1))
+    for name, path in single_paths().items():
+        results['single'][name] = time_call(lambda: path(a90, a10, p90, p10))
+
+    for name, path in batch_paths().items():
+        results['batch'][name] = {}
+        for n in scales:
+            inputs = scenarios(n)
+            # the per-scenario loop is only timed at small scales
+            if 'loop' in name and n > 10000:
+                continue
+            timing = time_call(lambda: path(*inputs), repeat=3, min_time=0.)
+            timing['scenarios_per_s'] = n / timing['best_s']
+            timing['peak_bytes'] = peak_memory(lambda: path(*inputs))
+            results['batch'][name][str(n)] = timing
+
+            if profile_dir is not None:
+                profile_dir.mkdir(parents=True, exist_ok=True)
+                profiler = cProfile.Profile()
+                profiler.runcall(path, *inputs)
+                safe = ''.join(c if c.isalnum() else '_' for c in name)
+                pstats.Stats(profiler).dump_stats(profile_dir / f'{safe}_{n}.prof')
+
+    results['import_heavy_modules'] = {}
+    for module in ('numpy', 'power_dens', 'confidence_Class'):
+        results['import_s'][module], results['import_heavy_modules'][module] = import_time(module)
+
+    results['agreement'] = check_agreement()
+    results['montecarlo_agreement'] = check_monte_carlo()
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(old_path, new_path):
+    """Print speed ratios (old / new, above 1 is faster) between two result files"""
+    old, new = (json.loads(Path(p).read_text()) for p in (old_path, new_path))
+    print(f"{old['commit']} -> {new['commit']}")
+
+    for name, timing in new['results']['single'].items():
+        if name in old['results']['single']:
+            print(f"single  {name:55s} x{old['results']['single'][name]['best_s'] / timing['best_s']:8.2f}")
+    for name, by_scale in new['results']['batch'].items():
+        for n, timing in by_scale.items():
+            previous = old['results']['batch'].get(name, {}).get(n)
+            if previous:
+                print(f"batch   {name + ' N=' + n:55s} x{previous['best_s'] / timing['best_s']:8.2f}")
+    for module, seconds in new['results']['import_s'].items():
+        if module in old['results']['import_s']:
+            print(f"import  {module:55s} x{old['results']['import_s'][module] / seconds:8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the capacity code paths")
+    subparsers = parser.add_subparsers(dest='command')
+    compare_parser = subparsers.add_parser('compare', help="compare two result files")
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    parser.add_argument('--scales', type=int, nargs='+', default=[10, 1000, 100000],
+                        help="numbers of scenarios for the throughput benchmarks")
+    parser.add_argument('--output', type=Path, help="result file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument('--profile', action='store_true', help="also write cProfile stats next to the results")
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        compare(args.old, args.new)
+        return
+
+    commit = git_commit()
+    output = args.output or RESULTS_DIR / f'{commit}.json'
+    profile_dir = output.with_suffix('') if args.profile else None
+
+    results = run(args.scales, profile_dir)
+    record = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(record, indent=2))
+
+    for name, error in results['agreement'].items():
+        print(f"agreement {name:60s} {error:.2e}")
+    for name, error in results['montecarlo_agreement'].items():
+        print(f"montecarlo {name:59s} {error:.2e}")
+    print(f"results written to {output}")
+
+    for module, seconds in results['import_s'].items():
+        print(f"import    {module:60s} {seconds:.3f} s")
+    problems = check_import_budget(results['import_s'], results['import_heavy_modules'])
+    for problem in problems:
+        print(f"import budget: {problem}")
+
+    # a speedup must never change the answers
+    if max(results['agreement'].values()) > TOLERANCE:
+        sys.exit("numeric agreement check failed")
+    if max(results['montecarlo_agreement'].values()) > MC_TOLERANCE:
+        sys.exit("Monte Carlo correlation check failed")
+    if problems:
+        sys.exit("import budget check failed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""Analogue lookup over the power density database
+
+The database is indexed once: temperatures are kept as a sorted array so a temperature
+window is two binary searches, and tectonic setting, system type and enthalpy class are
+stored as integer codes so filters are integer comparisons. Queries return the matching
+fields and the empirical P90/P50/P10 power density of the analogues, either for one
+prospect or for many prospects in one vectorized call.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import power_data
+
+TEMPERATURE = 'Average temperature [degC]'
+POWER_DENSITY = 'Power density [MWe/km2]'
+CATEGORIES = {'tectonic_setting': 'Tectonic setting',
+              'system_type': 'System type',
+              'enthalpy': 'Enthalpy classification'}
+
+# Empirical P90 (pessimistic) is the 10th percentile of the analogue power densities
+P_VALUE_QUANTILES = np.array([0.1, 0.5, 0.9])
+
+AnalogueMatch = namedtuple('AnalogueMatch', ['rows', 'count', 'P90', 'P50', 'P10'])
+
+
+class AnalogueIndex(object):
+    """Queryable index of developed fields by temperature and geological setting
+
+    :param database: power density database as a DataFrame. Defaults to
+        data/PowerDensityDatabase_Expanded.csv
+    """
+
+    def __init__(self, database=None):
+        if database is None:
+            database = power_data.load_database()
+
+        # sort once by temperature; all row numbers refer to this order
+        self.frame = database.sort_values(TEMPERATURE, kind='stable').reset_index(drop=True)
+        self.temperature = self.frame[TEMPERATURE].to_numpy(dtype=float)
+        self.power_density = self.frame[POWER_DENSITY].to_numpy(dtype=float)
+        self.pd_order = np.argsort(self.power_density, kind='stable')
+
+        # categorical codes, -1 where the category is missing
+        self.codes = {}
+        self.categories = {}
+        for name, column in CATEGORIES.items():
+            codes, uniques = pd.factorize(self.frame[column])
+            self.codes[name] = codes
+            self.categories[name] = {value: code for code, value in enumerate(uniques)}
+
+    def __len__(self):
+        return len(self.temperature)
+
+    def _code(self, name, value):
+        """Integer code of a category value, -2 (matches nothing) if it is not in the database"""
+        return self.categories[name].get(value, -2)
+
+    def _mask(self, rows, name, value):
+        """Restrict candidate rows to one category value or a list of values"""
+        if value is None:
+            return rows
+        values = [value] if isinstance(value, str) else value
+        codes = [self._code(name, v) for v in values]
+        return rows[np.isin(self.codes[name][rows], codes)]
+
+    def query(self, tmin: float, tmax: float, tectonic_setting=None, system_type=None, enthalpy=None):
+        """Find analogues in a temperature window and their empirical power density range
+
+        Args:
+            tmin (float): lower bound of average temperature in degC (inclusive)
+            tmax (float): upper bound of average temperature in degC (inclusive)
+            tectonic_setting (str or list, optional): allowed tectonic setting(s)
+            system_type (str or list, optional): allowed system type(s)
+            enthalpy (str or list, optional): allowed enthalpy classification(s)
+
+        Returns:
+            match (AnalogueMatch): row numbers into self.frame, number of analogues and the
+                P90, P50 and P10 power density in MWe/km2 (NaN when nothing matches)
+        """
+        start = np.searchsorted(self.temperature, tmin, side='left')
+        stop = np.searchsorted(self.temperature, tmax, side='right')
+        rows = np.arange(start, stop)
+
+        rows = self._mask(rows, 'tectonic_setting', tectonic_setting)
+        rows = self._mask(rows, 'system_type', system_type)
+        rows = self._mask(rows, 'enthalpy', enthalpy)
+
+        if len(rows):
+            p90, p50, p10 = np.quantile(self.power_density[rows], P_VALUE_QUANTILES)
+        else:
+            p90 = p50 = p10 = np.nan
+
+        return AnalogueMatch(rows, len(rows), p90, p50, p10)
+
+    def matches(self, tmin: float, tmax: float, **filters):
+        """Matching fields as a DataFrame, see query for the arguments"""
+        return self.frame.iloc[self.query(tmin, tmax, **filters).rows]
+
+    def _batch_codes(self, name, values, n):
+        """Per-prospect category codes for a batch, -1 where the filter is not applied"""
+        if values is None:
+            return np.full(n, -1)
+        values = np.broadcast_to(np.asarray(values, dtype=object), (n,))
+        return np.array([-1 if v is None else self._code(name, v) for v in values])
+
+    def query_batch(self, tmin, tmax, tectonic_setting=None, system_type=None, enthalpy=None):
+        """Empirical power density range of the analogues of many prospects in one call
+
+        Args:
+            tmin (array): lower bound of average temperature in degC per prospect
+            tmax (array): upper bound of average temperature in degC per prospect
+            tectonic_setting (array, optional): tectonic setting per prospect, None for any
+            system_type (array, optional): system type per prospect, None for any
+            enthalpy (array, optional): enthalpy classification per prospect, None for any
+
+        Returns:
+            count (ndarray): number of analogues per prospect
+            pvalues (ndarray): P90, P50 and P10 power density per prospect, shape
+                (prospects, 3), NaN where nothing matches
+        """
+        tmin, tmax = np.broadcast_arrays(np.atleast_1d(np.asarray(tmin, dtype=float)),
+                                         np.atleast_1d(np.asarray(tmax, dtype=float)))
+        n = len(tmin)
+
+        # (prospects, fields) match matrix, columns ordered by power density
+        temperature = self.temperature[self.pd_order]
+        mask = (temperature >= tmin[:, None]) & (temperature <= tmax[:, None])
+        for name, values in (('tectonic_setting', tectonic_setting),
+                             ('system_type', system_type),
+                             ('enthalpy', enthalpy)):
+            wanted = self._batch_codes(name, values, n)[:, None]
+            mask &= (wanted == -1) | (self.codes[name][self.pd_order] == wanted)
+
+        count = mask.sum(axis=1)
+        rank = np.cumsum(mask, axis=1)
+        sorted_pd = self.power_density[self.pd_order]
+
+        # linear interpolation between order statistics, as np.quantile does
+        position = (count[:, None] - 1) * P_VALUE_QUANTILES[None, :]
+        lower = np.floor(position)
+        fraction = position - lower
+
+        def order_statistic(k):
+            # column of the (k+1)-th matching field in each row
+            column = (rank[:, None, :] <= k[:, :, None]).sum(axis=2)
+            return sorted_pd[np.minimum(column, len(sorted_pd) - 1)]
+
+        upper = np.minimum(lower + 1, np.maximum(count[:, None] - 1, 0))
+        pvalues = order_statistic(lower) * (1 - fraction) + order_statistic(upper) * fraction
+        pvalues[count == 0] = np.nan
+
+        return count, pvalues
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""Shared capacity core with pluggable compute backends
+
+Every cumulative confidence curve in the repo is the lognormal quantile function
+exp(mu + sigma z) of the capacity mu and sigma (power_dens.capacity_params) over the
+z-values of a quantile grid. quantile_matrix evaluates it for a batch of scenarios on one
+of these backends:
+
+- 'numpy': a single broadcast, used for small and medium batches
+- 'numba': a JIT-compiled kernel, only available when numba is installed; compiled on
+  first use, so importing this module stays NumPy-only
+- 'process': rows split into chunks that are evaluated on a pool of worker processes
+
+With backend='auto' the backend is chosen by the number of curve values among the
+in-process backends only. The process pool is opt-in with backend='process': starting
+worker processes from library code needs an `if __name__ == '__main__'` guard in the
+calling script and would nest pools inside workers such as those of power_cli. All backends
+form mu + sigma z with one multiply and one add per value and take the exponential with
+np.exp, so they return identical results, bit for bit. Further backends can be added
+with register_backend.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import importlib.util
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Curve values (scenarios x quantiles) from which 'auto' moves to the JIT backend
+JIT_MIN_VALUES = 2**18
+
+# Scenarios per chunk of the process backend
+CHUNK_SIZE = 2**16
+
+
+def _numpy_kernel(mu, sigma, z, out):
+    """exp(mu + sigma z) of (scenarios,) mu and sigma against (quantiles,) z, into out"""
+    with np.errstate(invalid='ignore'):
+        np.multiply(sigma[:, None], z[None, :], out=out)
+    # without spread the curve is exp(mu) throughout, also where z is infinite
+    np.copyto(out, 0., where=(sigma == 0)[:, None])
+    out += mu[:, None]
+    return np.exp(out, out=out)
+
+
+class NumpyBackend(object):
+    """Plain NumPy broadcast in the calling process"""
+
+    name = 'numpy'
+
+    def available(self):
+        return True
+
+    def quantile_matrix(self, mu, sigma, z, out):
+        return _numpy_kernel(mu, sigma, z, out)
+
+
+class NumbaBackend(object):
+    """JIT-compiled loop over the curve values, parallel over scenarios
+
+    The kernel only fills in mu + sigma z (mu alone without spread), without contracting
+    it into a fused multiply-add, and the exponential is left to np.exp, so the result matches the
+    NumPy backend exactly while no (scenarios, quantiles) temporaries are created.
+    """
+
+    name = 'numba'
+
+    def __init__(self):
+        self._kernel = None
+
+    def available(self):
+        return importlib.util.find_spec('numba') is not None
+
+    def _compile(self):
+        import numba
+
+        @numba.njit(parallel=True, fastmath=False, cache=True)
+        def kernel(mu, sigma, z, out):
+            for i in numba.prange(mu.shape[0]):
+                for j in range(z.shape[0]):
+                    out[i, j] = mu[i] if sigma[i] == 0 else mu[i] + sigma[i] * z[j]
+
+        return kernel
+
+    def quantile_matrix(self, mu, sigma, z, out):
+        if self._kernel is None:
+            self._kernel = self._compile()
+        self._kernel(mu, sigma, z, out)
+        return np.exp(out, out=out)
+
+
+def _process_chunk(mu, sigma, z):
+    """Worker function of the process backend"""
+    return _numpy_kernel(mu, sigma, z, np.empty((len(mu), len(z))))
+
+
+class ProcessBackend(object):
+    """Rows split into chunks and evaluated with the NumPy kernel on worker processes
+
+    Only used when asked for by name. The pool is started on first use and kept for
+    later batches; workers are spawned, not forked, so they do not inherit sockets or
+    threads of a server or app, and the calling script needs an
+    `if __name__ == '__main__'` guard.
+
+    :param n_jobs: number of worker processes, defaults to the number of CPUs
+    :param chunk_size: scenarios per chunk
+    """
+
+    name = 'process'
+
+    def __init__(self, n_jobs: int=None, chunk_size: int=CHUNK_SIZE):
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._executor = None
+
+    def available(self):
+        return True
+
+    def quantile_matrix(self, mu, sigma, z, out):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.n_jobs,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        starts = range(0, len(mu), self.chunk_size)
+        chunks = [slice(start, start + self.chunk_size) for start in starts]
+        results = self._executor.map(_process_chunk, [mu[c] for c in chunks], [sigma[c] for c in chunks],
+                                     [z] * len(chunks))
+        for chunk, values in zip(chunks, results):
+            out[chunk] = values
+        return out
+
+    def close(self):
+        """Shut down the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+BACKENDS = {'numpy': NumpyBackend(), 'numba': NumbaBackend(), 'process': ProcessBackend()}
+
+
+def register_backend(backend):
+    """Add or replace a backend, an object with a name and available() and quantile_matrix() methods"""
+    BACKENDS[backend.name] = backend
+
+
+def available_backends():
+    """Names of the backends that can run here"""
+    return [name for name, backend in BACKENDS.items() if backend.available()]
+
+
+def select_backend(n_values: int):
+    """Name of the in-process backend 'auto' uses for a batch of n_values curve values"""
+    if n_values >= JIT_MIN_VALUES and BACKENDS['numba'].available():
+        return 'numba'
+    return 'numpy'
+
+
+def quantile_matrix(mu, sigma, z, backend: str='auto'):
+    """Evaluate the lognormal quantiles exp(mu + sigma z) of a batch of scenarios
+
+    Args:
+        mu (array): (scenarios,) mean of the natural log of capacity
+        sigma (array): (scenarios,) standard deviation of the natural log of capacity
+        z (array): (quantiles,) standard normal z-values of the quantile grid
+        backend (str): 'auto' (NumPy or numba by batch size), or the name of a backend,
+            e.g. 'numpy', 'numba' or 'process'
+
+    Returns:
+        eds (ndarray): expected development size in MW, shape (scenarios, quantiles)
+    """
+    mu = np.ascontiguousarray(mu, dtype=float)
+    sigma = np.ascontiguousarray(sigma, dtype=float)
+    z = np.ascontiguousarray(z, dtype=float)
+    if mu.ndim != 1 or mu.shape != sigma.shape or z.ndim != 1:
+        raise ValueError("mu and sigma should be 1-D and of the same length, z 1-D")
+
+    if backend == 'auto':
+        backend = select_backend(mu.size * z.size)
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend}, expected 'auto' or one of {list(BACKENDS)}")
+    if not BACKENDS[backend].available():
+        raise ValueError(f"backend {backend} is not available here")
+
+    return BACKENDS[backend].quantile_matrix(mu, sigma, z, np.empty((len(mu), len(z))))
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""Command-line batch runner for power density scenario files
+
+Reads a scenario table (CSV or Parquet) with areaP90, areaP10, pdP90 and pdP10 columns
+plus an ID column in chunks, computes the P90/P50/P10 capacity and optionally the full
+cumulative confidence curve of every scenario in worker processes, and streams the
+results to disk chunk by chunk so memory stays bounded however long the file is.
+
+Example:
+    python power_cli.py scenarios.csv summary.csv --curves curves.csv --jobs 4
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import argparse
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import power_dens
+
+INPUT_COLUMNS = ['areaP90', 'areaP10', 'pdP90', 'pdP10']
+
+
+def _is_parquet(path):
+    return Path(path).suffix.lower() in ('.parquet', '.pq')
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet files need pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def read_scenarios(path, id_column: str='id', chunksize: int=100000):
+    """Iterate over a scenario file in chunks of at most chunksize rows
+
+    Args:
+        path (str): CSV or Parquet file
+        id_column (str): name of the scenario ID column
+        chunksize (int): rows per chunk
+
+    Yields:
+        chunk (pandas Dataframe): ID and input columns of the next rows
+    """
+    columns = [id_column] + INPUT_COLUMNS
+
+    if _is_parquet(path):
+        pyarrow = _require_pyarrow()
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+def process_chunk(chunk, id_column: str='id', curves: bool=False, quantiles=None):
+    """Compute the P-value summary and optionally the confidence curves of one chunk
+
+    Args:
+        chunk (pandas Dataframe): ID and input columns
+        id_column (str): name of the scenario ID column
+        curves (bool): also return the cumulative confidence curves
+        quantiles (array, optional): quantile grid for the curves, defaults to power_dens.CONF_GRID
+
+    Returns:
+        summary (pandas Dataframe): inputs with P90, P50 and P10 capacity in MWe
+        curves (pandas Dataframe or None): one row per scenario, one column per
+            cumulative confidence (%)
+    """
+    inputs = [chunk[column].to_numpy(dtype=float) for column in INPUT_COLUMNS]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pvalues = power_dens.capacity_pvalues(*inputs)
+        eds = power_dens.calculate_cumulative_conf_batch(*inputs, quantiles=quantiles) if curves else None
+
+    summary = chunk[[id_column] + INPUT_COLUMNS].reset_index(drop=True)
+    summary['P90 (MWe)'] = pvalues[:, 0]
+    summary['P50 (MWe)'] = pvalues[:, 1]
+    summary['P10 (MWe)'] = pvalues[:, 2]
+
+    curves_df = None
+    if curves:
+        grid, _ = power_dens.quantile_grid(quantiles)
+        curves_df = pd.DataFrame(eds, columns=[str(x) for x in power_dens.confidence_labels(grid)])
+        curves_df.insert(0, id_column, chunk[id_column].to_numpy())
+
+    return summary, curves_df
+
+
+def _render(frame, parquet):
+    """Prepare a result frame for writing; CSV text is formatted here, in the worker"""
+    if parquet:
+        return frame
+    return frame.to_csv(index=False, lineterminator='\n')
+
+
+def _run_chunk(chunk, options, parquet_summary, parquet_curves):
+    """Worker task: process one chunk and format its output"""
+    summary, curves_df = process_chunk(chunk, **options)
+    return (_render(summary, parquet_summary),
+            None if curves_df is None else _render(curves_df, parquet_curves))
+
+
+class _ChunkWriter(object):
+    """Append chunks to a CSV or Parquet file as they arrive"""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = _is_parquet(path)
+        self.writer = None
+        self.handle = None
+
+    def write(self, result):
+        if self.parquet:
+            pyarrow = _require_pyarrow()
+            table = pyarrow.Table.from_pandas(result, preserve_index=False)
+            if self.writer is None:
+                self.writer = pyarrow.parquet.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        elif self.handle is None:
+            self.handle = open(self.path, 'w', newline='')
+            self.handle.write(result)
+        else:
+            # every rendered chunk carries the header line; keep only the first
+            self.handle.write(result.split('\n', 1)[1])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.handle is not None:
+            self.handle.close()
+
+
+def run(input_path, output_path, curves_path=None, id_column: str='id', chunksize: int=100000,
+        n_jobs: int=1, quantiles=None):
+    """Process a scenario file chunk by chunk and stream the results to disk
+
+    At most 2 * n_jobs chunks are in flight at once, and results are written in input order.
+    Workers also format CSV output, which for full curves costs more than the calculation.
+
+    Args:
+        input_path (str): CSV or Parquet scenario file
+        output_path (str): CSV or Parquet file for the P90/P50/P10 summary
+        curves_path (str, optional): CSV or Parquet file for the full confidence curves
+        id_column (str): name of the scenario ID column
+        chunksize (int): rows per chunk
+        n_jobs (int): worker processes, 1 runs in this process
+        quantiles (array, optional): quantile grid for the curves
+
+    Returns:
+        n (int): number of scenarios processed
+    """
+    summary_writer = _ChunkWriter(output_path)
+    curves_writer = _ChunkWriter(curves_path) if curves_path else None
+    chunks = read_scenarios(input_path, id_column=id_column, chunksize=chunksize)
+    options = dict(id_column=id_column, curves=curves_writer is not None, quantiles=quantiles)
+    task = (options, summary_writer.parquet, curves_writer is not None and curves_writer.parquet)
+
+    n = 0
+
+    def write(chunk, result):
+        summary, curves_out = result
+        summary_writer.write(summary)
+        if curves_writer is not None:
+            curves_writer.write(curves_out)
+        return len(chunk)
+
+    try:
+        if n_jobs == 1:
+            for chunk in chunks:
+                n += write(chunk, _run_chunk(chunk, *task))
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append((chunk, executor.submit(_run_chunk, chunk, *task)))
+                    if len(pending) >= 2 * n_jobs:
+                        chunk, future = pending.popleft()
+                        n += write(chunk, future.result())
+                while pending:
+                    chunk, future = pending.popleft()
+                    n += write(chunk, future.result())
+    finally:
+        summary_writer.close()
+        if curves_writer is not None:
+            curves_writer.close()
+
+    return n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculate power capacity for a file of P90/P10 scenarios")
+    parser.add_argument('input', help="CSV or Parquet file with an ID column and " + ", ".join(INPUT_COLUMNS))
+    parser.add_argument('output', help="CSV or Parquet file for the P90/P50/P10 summary")
+    parser.add_argument('--curves', help="CSV or Parquet file for the full cumulative confidence curves")
+    parser.add_argument('--id-column', default='id', help="name of the scenario ID column (default: id)")
+    parser.add_argument('--chunksize', type=int, default=100000, help="rows per chunk (default: 100000)")
+    parser.add_argument('--jobs', type=int, default=1, help="worker processes (default: 1)")
+    parser.add_argument('--step', type=float, default=None,
+                        help="confidence step of the curves in percent (default: 1, i.e. 100 points)")
+    args = parser.parse_args(argv)
+
+    quantiles = None if args.step is None else np.arange(0, 100, args.step) / 100
+
+    n = run(args.input, args.output, curves_path=args.curves, id_column=args.id_column,
+            chunksize=args.chunksize, n_jobs=args.jobs, quantiles=quantiles)
+    print(f"{n} scenarios written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
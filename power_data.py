@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""Data access for the bundled power density databases
+
+Each CSV in data/ is parsed at most once per process into a typed DataFrame (numeric
+columns as float64, classification columns as categoricals). The parsed frame is
+memoized in memory and shared by every caller, e.g. all sessions of the Streamlit app,
+and is re-read only when the file's modification time changes. An optional on-disk
+binary cache lets a fresh process skip CSV parsing altogether.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import os
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+DATA_DIR = Path(__file__).resolve().parent / 'data'
+DEFAULT_DATABASE = 'PowerDensityDatabase_Expanded.csv'
+
+# Set to a directory to enable the on-disk binary cache for every process
+CACHE_DIR_ENV = 'POWERDENS_CACHE_DIR'
+
+NUMERIC_COLUMNS = ['Average temperature [degC]', 'Power density [MWe/km2]']
+CATEGORY_COLUMNS = ['Tectonic setting', 'System type', 'Enthalpy classification']
+
+_memo = {}
+_lock = threading.Lock()
+
+
+def _typed(frame):
+    """Convert a freshly parsed database to a typed columnar snapshot"""
+    for column in frame.columns:
+        if column in NUMERIC_COLUMNS:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').astype('float64')
+        elif column in CATEGORY_COLUMNS:
+            frame[column] = frame[column].astype('category')
+        elif frame[column].dtype == object:
+            frame[column] = frame[column].astype('string')
+    return frame
+
+
+def _cache_path(cache_dir, path, stat):
+    """Binary cache file for one version (mtime and size) of a CSV"""
+    return Path(cache_dir) / f'{path.stem}.{stat.st_mtime_ns}.{stat.st_size}.pkl'
+
+
+def _read(path, stat, cache_dir):
+    """Parse a CSV, going through the on-disk binary cache if one is configured"""
+    if cache_dir is None:
+        return _typed(pd.read_csv(path, encoding='utf-8-sig'))
+
+    cache_file = _cache_path(cache_dir, path, stat)
+    if cache_file.exists():
+        return pd.read_pickle(cache_file)
+
+    frame = _typed(pd.read_csv(path, encoding='utf-8-sig'))
+
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    for stale in cache_file.parent.glob(f'{path.stem}.*.pkl'):
+        stale.unlink()
+    # write then rename so concurrent processes never read a partial file
+    partial = cache_file.with_suffix(f'.{os.getpid()}.tmp')
+    frame.to_pickle(partial)
+    partial.replace(cache_file)
+
+    return frame
+
+
+def load_database(name: str=DEFAULT_DATABASE, cache_dir=None):
+    """Load a bundled database, parsing the CSV only when it is new or has changed
+
+    The returned DataFrame is shared between callers and must be treated as read-only;
+    take a .copy() before modifying it.
+
+    Args:
+        name (str): file name in data/, or a path to another CSV
+        cache_dir (str or Path, optional): directory for the on-disk binary cache.
+            Defaults to the POWERDENS_CACHE_DIR environment variable, if set.
+
+    Returns:
+        frame (pandas Dataframe): typed power density database
+    """
+    path = Path(name)
+    if not path.is_absolute() and not path.exists():
+        path = DATA_DIR / name
+    path = path.resolve()
+
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_ENV)
+
+    stat = path.stat()
+    with _lock:
+        cached = _memo.get(path)
+        if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+
+        frame = _read(path, stat, cache_dir)
+        _memo[path] = ((stat.st_mtime_ns, stat.st_size), frame)
+
+    return frame
+
+
+def clear_cache():
+    """Drop the in-memory copies so the next load re-reads the files"""
+    with _lock:
+        _memo.clear()
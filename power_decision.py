@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+"""Expected value and value of information of exploration drilling decisions
+
+A prospect is drilled at a cost; with its probability of exploration success (POS) the
+well finds a resource whose capacity follows the lognormal power density distribution,
+and the resource is then developed for a net value of (revenue - cost) per MWe less a
+fixed development cost. Walking away is always possible and worth 0, so every decision
+is the maximum of its alternatives.
+
+Data acquisition before drilling (e.g. an MT survey or temperature gradient holes) is an
+imperfect test of success, described by its cost, its sensitivity P(positive | success)
+and its specificity P(negative | failure). Its value of information is the expected
+value of deciding after the result, with the POS updated by Bayes' rule, less the
+expected value of deciding now.
+
+Expectations over capacity are closed-form partial expectations of the lognormal capacity
+distribution, so the development decision after success can depend on the capacity
+found. Prospect arrays are of length N, and test parameters given as arrays of length A
+(alternatives) give results of shape (N, A), all in one batch.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import numpy as np
+import pandas as pd
+
+import power_dens
+
+PROSPECT_COLUMNS = ['pos', 'areaP90', 'areaP10', 'pdP90', 'pdP10']
+ALTERNATIVE_COLUMNS = ['cost', 'sensitivity', 'specificity']
+
+
+def _prospects(pos, areaP90, areaP10, pdP90, pdP10, correlation):
+    """POS, capacity mu and sigma of the prospects as 1-D arrays of equal length"""
+    inputs = power_dens._scenario_arrays(areaP90, areaP10, pdP90, pdP10)
+    capacity_mu, capacity_sigma = np.broadcast_arrays(*power_dens.capacity_params(*inputs, correlation=correlation))
+    pos = np.broadcast_to(np.asarray(pos, dtype=float), capacity_mu.shape)
+    if np.any((pos < 0) | (pos > 1)):
+        raise ValueError("pos should be fractions between 0 and 1")
+    return pos, capacity_mu, capacity_sigma
+
+
+def success_value(capacity_mu, capacity_sigma, margin, development_cost=0., capacity_revealed: bool=True):
+    """Expected value of a successful well, developing only when it pays
+
+    With the capacity revealed, development pays above the threshold capacity
+    K / m, so the value is the lognormal partial expectation
+    m E[C; C > K / m] - K P(C > K / m) = m exp(mu + sigma^2 / 2) N(d1) - K N(d2).
+
+    Args:
+        capacity_mu, capacity_sigma (array): (prospects,) log-space capacity parameters
+        margin (float or array): net value per MWe developed, revenue less cost per MWe
+        development_cost (float or array): fixed cost of developing a discovery
+        capacity_revealed (bool): if True the successful well (and its appraisal) shows the
+            capacity, so small discoveries are not developed: E[max(margin C - cost, 0)].
+            If False development is decided on the distribution: max(margin E[C] - cost, 0).
+
+    Returns:
+        value (ndarray): (prospects,) expected value given success
+    """
+    capacity_mu = np.asarray(capacity_mu, dtype=float)
+    capacity_sigma = np.asarray(capacity_sigma, dtype=float)
+    margin, development_cost = (np.broadcast_to(np.asarray(x, dtype=float), capacity_mu.shape)
+                                for x in (margin, development_cost))
+
+    if not capacity_revealed:
+        return np.maximum(margin * np.exp(capacity_mu + capacity_sigma**2 / 2) - development_cost, 0)
+
+    # capacity at which margin C - cost changes sign; at or below 0 every discovery is on one side
+    with np.errstate(divide='ignore', invalid='ignore'):
+        threshold = np.maximum(np.where(margin != 0, development_cost / margin, np.inf), 0)
+    above, above_mean = power_dens.lognormal_partials(threshold, capacity_mu, capacity_sigma, upper=True)
+    below, below_mean = power_dens.lognormal_partials(threshold, capacity_mu, capacity_sigma)
+
+    # a positive margin pays above the threshold, a negative one below it
+    value = np.where(margin > 0, margin * above_mean - development_cost * above,
+                     np.where(margin < 0, margin * below_mean - development_cost * below,
+                              np.maximum(-development_cost, 0)))
+
+    return np.maximum(value, 0)
+
+
+def _decide(pos, value, drilling_cost):
+    """Expected value of drilling or walking away, whichever is better"""
+    return np.maximum(pos * value - drilling_cost, 0)
+
+
+def expected_value(pos, areaP90, areaP10, pdP90, pdP10, revenue_per_mwe, cost_per_mwe=0., development_cost=0.,
+                   drilling_cost=0., correlation=0., capacity_revealed: bool=True):
+    """Expected value of the drilling decision for many prospects
+
+    Args:
+        pos (float or array): probability of exploration success, as fractions
+        areaP90, areaP10, pdP90, pdP10 (array): capacity inputs of the prospects
+        revenue_per_mwe, cost_per_mwe (float or array): value and development cost per MWe,
+            e.g. the net present values in M$/MWe
+        development_cost (float or array): fixed cost of developing a discovery
+        drilling_cost (float or array): cost of the exploration well(s)
+        correlation (float or array): correlation of log area and log power density
+        capacity_revealed (bool): see success_value
+
+    Returns:
+        value_df (pandas Dataframe): per prospect the value given success, the expected
+            value of drilling (pos * success value - drilling cost, may be negative), the
+            expected value of the decision (at least 0) and whether to drill
+    """
+    pos, capacity_mu, capacity_sigma = _prospects(pos, areaP90, areaP10, pdP90, pdP10, correlation)
+    margin = np.asarray(revenue_per_mwe, dtype=float) - np.asarray(cost_per_mwe, dtype=float)
+    value = success_value(capacity_mu, capacity_sigma, margin, development_cost, capacity_revealed)
+    drill = pos * value - np.asarray(drilling_cost, dtype=float)
+
+    value_df = pd.DataFrame({'success value': value, 'drilling value': drill,
+                             'expected value': np.maximum(drill, 0), 'drill': drill > 0},
+                            index=pd.RangeIndex(len(pos), name='prospect'))
+
+    return value_df
+
+
+def information_value(pos, value, drilling_cost, sensitivity, specificity, cost=0.):
+    """Value of an imperfect test of success, from the POS and the value given success
+
+    Args:
+        pos, value, drilling_cost (float or array): (prospects,) POS, value given success
+            (success_value) and drilling cost
+        sensitivity (float or array): P(positive result | success), scalar or (alternatives,)
+        specificity (float or array): P(negative result | failure), scalar or (alternatives,)
+        cost (float or array): cost of the test, scalar or (alternatives,)
+
+    Returns:
+        expected_value (ndarray): value of testing first and then deciding, net of the test
+            cost; (prospects,) or (prospects, alternatives)
+        voi (ndarray): value of information, the expected value of deciding after the result
+            less that of deciding now, before the test cost; never negative
+    """
+    sensitivity, specificity, cost = (np.asarray(x, dtype=float) for x in (sensitivity, specificity, cost))
+    if np.any((sensitivity < 0) | (sensitivity > 1) | (specificity < 0) | (specificity > 1)):
+        raise ValueError("sensitivity and specificity should be fractions between 0 and 1")
+
+    pos, value, drilling_cost = (np.asarray(x, dtype=float) for x in (pos, value, drilling_cost))
+    without = _decide(pos, value, drilling_cost)
+    if max(sensitivity.ndim, specificity.ndim, cost.ndim):
+        pos, value, drilling_cost, without = (np.expand_dims(x, -1) for x in (pos, value, drilling_cost, without))
+
+    # P(result) * E[value | result] = max(P(result and success) * value - P(result) * drilling cost, 0)
+    positive = pos * sensitivity + (1 - pos) * (1 - specificity)
+    with_test = (np.maximum(pos * sensitivity * value - positive * drilling_cost, 0)
+                 + np.maximum(pos * (1 - sensitivity) * value - (1 - positive) * drilling_cost, 0))
+    voi = with_test - without
+
+    return with_test - cost, voi
+
+
+def value_of_information(pos, areaP90, areaP10, pdP90, pdP10, revenue_per_mwe, sensitivity, specificity,
+                         cost=0., cost_per_mwe=0., development_cost=0., drilling_cost=0., correlation=0.,
+                         capacity_revealed: bool=True):
+    """Value of information of data acquisition before drilling, for prospects x alternatives
+
+    Args:
+        pos, areaP90, areaP10, pdP90, pdP10: prospects, see expected_value
+        revenue_per_mwe (float or array): value per MWe developed
+        sensitivity, specificity (float or array): reliability of each alternative, see
+            information_value; perfect information has both equal to 1
+        cost (float or array): cost of each alternative
+        cost_per_mwe, development_cost, drilling_cost, correlation, capacity_revealed: see
+            expected_value
+
+    Returns:
+        voi (ndarray): value of information before the test cost; compare it with the
+            cost to decide whether the data are worth acquiring. (prospects,) or
+            (prospects, alternatives).
+    """
+    pos, capacity_mu, capacity_sigma = _prospects(pos, areaP90, areaP10, pdP90, pdP10, correlation)
+    margin = np.asarray(revenue_per_mwe, dtype=float) - np.asarray(cost_per_mwe, dtype=float)
+    value = success_value(capacity_mu, capacity_sigma, margin, development_cost, capacity_revealed)
+    drilling_cost = np.broadcast_to(np.asarray(drilling_cost, dtype=float), pos.shape)
+
+    return information_value(pos, value, drilling_cost, sensitivity, specificity, cost)[1]
+
+
+def perfect_information_value(pos, areaP90, areaP10, pdP90, pdP10, revenue_per_mwe, cost_per_mwe=0.,
+                              development_cost=0., drilling_cost=0., correlation=0.):
+    """Value of perfect information on both success and capacity before drilling
+
+    An upper bound on the value of any data acquisition: only prospects that succeed with
+    a capacity worth its drilling and development cost are drilled.
+
+    Returns:
+        voi (ndarray): (prospects,) value of perfect information
+    """
+    pos, capacity_mu, capacity_sigma = _prospects(pos, areaP90, areaP10, pdP90, pdP10, correlation)
+    margin = np.asarray(revenue_per_mwe, dtype=float) - np.asarray(cost_per_mwe, dtype=float)
+    drilling_cost = np.asarray(drilling_cost, dtype=float)
+    development_cost = np.asarray(development_cost, dtype=float)
+
+    value = success_value(capacity_mu, capacity_sigma, margin, development_cost, True)
+    informed = success_value(capacity_mu, capacity_sigma, margin, development_cost + drilling_cost, True)
+
+    return pos * informed - _decide(pos, value, drilling_cost)
+
+
+def evaluate_alternatives(prospects, alternatives, revenue_per_mwe, cost_per_mwe=0., development_cost=0.,
+                          drilling_cost=0., correlation=0., capacity_revealed: bool=True):
+    """Expected value of every prospect and data acquisition alternative in one batch
+
+    Args:
+        prospects (pandas Dataframe): one row per prospect with the columns pos, areaP90,
+            areaP10, pdP90 and pdP10, and optionally revenue_per_mwe, cost_per_mwe,
+            development_cost, drilling_cost and correlation, which override the arguments
+        alternatives (pandas Dataframe): one row per alternative, indexed by name, with the
+            columns cost, sensitivity and specificity
+        revenue_per_mwe, cost_per_mwe, development_cost, drilling_cost, correlation,
+            capacity_revealed: see expected_value
+
+    Returns:
+        decision_df (pandas Dataframe): indexed by prospect and alternative, including
+            'decide now' (no data); columns are the expected value net of the data cost,
+            the value of information, its value net of the cost, and 'best', True for the
+            alternative with the highest expected value of each prospect
+    """
+    missing = set(PROSPECT_COLUMNS) - set(prospects.columns)
+    missing |= set(ALTERNATIVE_COLUMNS) - set(alternatives.columns)
+    if missing:
+        raise ValueError(f"missing columns {sorted(missing)}")
+
+    settings = dict(revenue_per_mwe=revenue_per_mwe, cost_per_mwe=cost_per_mwe, development_cost=development_cost,
+                    drilling_cost=drilling_cost, correlation=correlation)
+    settings = {name: prospects[name].to_numpy(dtype=float) if name in prospects else np.asarray(value, dtype=float)
+                for name, value in settings.items()}
+
+    pos, capacity_mu, capacity_sigma = _prospects(*(prospects[name].to_numpy(dtype=float) for name in PROSPECT_COLUMNS),
+                                                  settings['correlation'])
+    margin = settings['revenue_per_mwe'] - settings['cost_per_mwe']
+    value = success_value(capacity_mu, capacity_sigma, margin, settings['development_cost'], capacity_revealed)
+    drilling_cost = np.broadcast_to(settings['drilling_cost'], pos.shape)
+
+    now = _decide(pos, value, drilling_cost)
+    expected, voi = information_value(pos, value, drilling_cost, *(alternatives[name].to_numpy(dtype=float)
+                                                                   for name in ['sensitivity', 'specificity', 'cost']))
+
+    # (prospects, 1 + alternatives), 'decide now' first
+    expected = np.column_stack([now, expected])
+    voi = np.column_stack([np.zeros(len(pos)), voi])
+    costs = np.concatenate([[0.], alternatives['cost'].to_numpy(dtype=float)])
+    best = np.zeros(expected.shape, dtype=bool)
+    best[np.arange(len(pos)), np.argmax(expected, axis=1)] = True
+
+    names = ['decide now'] + [str(name) for name in alternatives.index]
+    index = pd.MultiIndex.from_product([prospects.index, names], names=['prospect', 'alternative'])
+    decision_df = pd.DataFrame({'expected value': expected.ravel(), 'value of information': voi.ravel(),
+                                'net value of information': (voi - costs).ravel(), 'best': best.ravel()},
+                               index=index)
+
+    return decision_df
@@ -4,13 +4,14 @@ __author__ = "William Cumming, Hannah Wood, Jan Niederau"
 __license__ = "Apache-2.0 License"
 
 # Import libraries
+# Only NumPy is imported at load time, for fast start-up in short-lived batch jobs.
+# pandas is imported where a DataFrame is built and the normal distribution is below.
 import numpy as np
-import pandas as pd
-import scipy
-from scipy.stats import norm, lognorm
-import matplotlib.pyplot as plt
 
-def calculate_cumulative_conf(areaP90: float=1., areaP10: float=10., pdP90: float=10., pdP10: float=24):
+import power_backends
+
+def calculate_cumulative_conf(areaP90: float=1., areaP10: float=10., pdP90: float=10., pdP10: float=24,
+                              quantiles=None, correlation: float=0.):
     """Calculate cumulative confidence level for expected development size in MW
 
     Args:
@@ -18,24 +19,480 @@ def calculate_cumulative_conf(areaP90: float=1., areaP10: float=10., pdP90: floa
         areaP10 (float): optimistic area in sqkm
         pdP90 (float): pessimistic power density in MWe/sqkm
         pdP10 (float): optimistic power density in MWe/sqkm
+        quantiles (array, optional): quantile grid as fractions in [0, 1).
+            Defaults to the 100-point grid 0.00, 0.01 ... 0.99.
+        correlation (float): correlation of log area and log power density, -1 to 1.
+            Defaults to 0, i.e. independent inputs.
 
     Returns:
         prob_df (pandas Dataframe): cumulative confidence curve in Reservoir Size
     """
-    # calculate area > 250 °C
-    area_mu = ((np.log(areaP90)+np.log(areaP10))/2)
-    area_sigma = (np.log(areaP10)-np.log(areaP90))/((norm.ppf(0.9)-(norm.ppf(0.1))))
+    # confidence of at least the expected development size, 100 .. 1 on the default grid
+    prob_df = capacity_curve(areaP90, areaP10, pdP90, pdP10, quantiles=quantiles,
+                             correlation=correlation).to_frame()
+
+    return prob_df
+
+
+# ==========================================
+# Standard normal distribution without scipy
+# ==========================================
+
+# W. J. Cody (1969) rational approximations for erf and erfc
+_ERF_A = (3.16112374387056560e00, 1.13864154151050156e02, 3.77485237685302021e02,
+          3.20937758913846947e03, 1.85777706184603153e-1)
+_ERF_B = (2.36012909523441209e01, 2.44024637934444173e02, 1.28261652607737228e03,
+          2.84423683343917062e03)
+_ERFC_C = (5.64188496988670089e-1, 8.88314979438837594e00, 6.61191906371416295e01,
+           2.98635138197400131e02, 8.81952221241769090e02, 1.71204761263407058e03,
+           2.05107837782607147e03, 1.23033935479799725e03, 2.15311535474403846e-8)
+_ERFC_D = (1.57449261107098347e01, 1.17693950891312499e02, 5.37181101862009858e02,
+           1.62138957456669019e03, 3.29079923573345963e03, 4.36261909014324716e03,
+           3.43936767414372164e03, 1.23033935480374942e03)
+_ERFC_P = (3.05326634961232344e-1, 3.60344899949804439e-1, 1.25781726111229246e-1,
+           1.60837851487422766e-2, 6.58749161529837803e-4, 1.63153871373020978e-2)
+_ERFC_Q = (2.56852019228982242e00, 1.87295284992346725e00, 5.27905102951428412e-1,
+           6.05183413124413191e-2, 2.33520497626869185e-3)
+
+# P. J. Acklam's rational approximation of the normal quantile function
+_PPF_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+          1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+_PPF_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+          6.680131188771972e+01, -1.328068155288572e+01)
+_PPF_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+          -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+_PPF_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+          3.754408661907416e+00)
+_PPF_LOW = 0.02425
+
+
+def _exp_minus_square(y):
+    """exp(-y**2), split as in Cody's code to avoid cancellation for large y"""
+    ysq = np.trunc(y * 16) / 16
+    return np.exp(-ysq * ysq) * np.exp(-(y - ysq) * (y + ysq))
+
+
+def _erfc_positive(y):
+    """erfc(y) for y >= 0"""
+    result = np.empty_like(y)
+
+    small = y <= 0.46875
+    ysq = y[small]**2
+    xnum, xden = _ERF_A[4] * ysq, ysq
+    for a, b in zip(_ERF_A[:3], _ERF_B[:3]):
+        xnum, xden = (xnum + a) * ysq, (xden + b) * ysq
+    result[small] = 1 - y[small] * (xnum + _ERF_A[3]) / (xden + _ERF_B[3])
+
+    middle = (y > 0.46875) & (y <= 4)
+    ym = y[middle]
+    xnum, xden = _ERFC_C[8] * ym, ym
+    for c, d in zip(_ERFC_C[:7], _ERFC_D[:7]):
+        xnum, xden = (xnum + c) * ym, (xden + d) * ym
+    result[middle] = _exp_minus_square(ym) * (xnum + _ERFC_C[7]) / (xden + _ERFC_D[7])
+
+    large = y > 4
+    yl = y[large]
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        ysq = 1 / yl**2
+        xnum, xden = _ERFC_P[5] * ysq, ysq
+        for p, q in zip(_ERFC_P[:4], _ERFC_Q[:4]):
+            xnum, xden = (xnum + p) * ysq, (xden + q) * ysq
+        tail = (0.56418958354775628695 - ysq * (xnum + _ERFC_P[4]) / (xden + _ERFC_Q[4])) / yl
+        # erfc underflows to zero beyond y ~ 27
+        result[large] = np.where(yl > 40, 0., _exp_minus_square(np.minimum(yl, 40)) * tail)
+
+    return result
+
+
+def norm_cdf(x):
+    """Standard normal cumulative distribution function, vectorized with NumPy only
+
+    Accurate to about 1e-15 relative, including far into both tails.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.abs(x).ravel() / np.sqrt(2)
+    upper = 0.5 * _erfc_positive(np.nan_to_num(y, nan=0., posinf=np.inf)).reshape(x.shape)
+
+    # the tail probability is exact for x < 0; the body is 1 - tail for x > 0
+    return np.where(np.isnan(x), np.nan, np.where(x < 0, upper, 1 - upper))
+
+
+def norm_sf(x):
+    """Standard normal survival function 1 - norm_cdf(x), accurate in the upper tail"""
+    return norm_cdf(-np.asarray(x, dtype=float))
+
+
+def norm_ppf(p):
+    """Standard normal quantile function, vectorized with NumPy only
+
+    Acklam's approximation refined by one Halley step on norm_cdf, accurate to about 1e-15.
+    """
+    p = np.asarray(p, dtype=float)
+    flat = p.ravel()
+    x = np.full(flat.shape, np.nan)
+
+    lower = (flat > 0) & (flat < _PPF_LOW)
+    upper = (flat > 1 - _PPF_LOW) & (flat < 1)
+    central = (flat >= _PPF_LOW) & (flat <= 1 - _PPF_LOW)
+
+    def tail(q):
+        num = ((((_PPF_C[0] * q + _PPF_C[1]) * q + _PPF_C[2]) * q + _PPF_C[3]) * q + _PPF_C[4]) * q + _PPF_C[5]
+        den = (((_PPF_D[0] * q + _PPF_D[1]) * q + _PPF_D[2]) * q + _PPF_D[3]) * q + 1
+        return num / den
+
+    x[lower] = tail(np.sqrt(-2 * np.log(flat[lower])))
+    x[upper] = -tail(np.sqrt(-2 * np.log1p(-flat[upper])))
+
+    q = flat[central] - 0.5
+    r = q * q
+    num = (((((_PPF_A[0] * r + _PPF_A[1]) * r + _PPF_A[2]) * r + _PPF_A[3]) * r + _PPF_A[4]) * r + _PPF_A[5]) * q
+    den = ((((_PPF_B[0] * r + _PPF_B[1]) * r + _PPF_B[2]) * r + _PPF_B[3]) * r + _PPF_B[4]) * r + 1
+    x[central] = num / den
+
+    # one Halley step; the error is taken on the smaller tail to keep relative accuracy
+    finite = lower | upper | central
+    xf = x[finite]
+    error = np.where(xf < 0, norm_cdf(xf) - flat[finite], (1 - flat[finite]) - norm_sf(xf))
+    u = error * np.sqrt(2 * np.pi) * np.exp(xf * xf / 2)
+    x[finite] = xf - u / (1 + xf * u / 2)
+
+    x[flat == 0] = -np.inf
+    x[flat == 1] = np.inf
+
+    return x.reshape(p.shape)
+
+
+# ===========================
+# Lognormal capacity helpers
+# ===========================
+
+# Quantile grid used by calculate_cumulative_conf, as fractions 0.00 .. 0.99
+CONF_GRID = np.arange(0, 100) / 100
+
+# Standard normal z-values of the grid, evaluated once instead of once per scenario
+CONF_GRID_Z = norm_ppf(CONF_GRID)
+
+# Spread between the P10 and P90 z-values, used to convert P90/P10 to a log-space sigma
+P90_P10_Z_SPAN = norm_ppf(0.9) - norm_ppf(0.1)
+
+# z-values of the P90, P50 and P10 (the 10th, 50th and 90th percentiles of capacity)
+P_VALUES_Z = norm_ppf([0.1, 0.5, 0.9])
+
+
+def quantile_grid(quantiles=None):
+    """Return a quantile grid and its standard normal z-values
+
+    Args:
+        quantiles (array, optional): quantiles as fractions in [0, 1). Defaults to CONF_GRID.
+
+    Returns:
+        quantiles (ndarray): the quantile grid
+        z (ndarray): standard normal z-values of the grid
+    """
+    if quantiles is None:
+        return CONF_GRID, CONF_GRID_Z
+
+    quantiles = np.atleast_1d(np.asarray(quantiles, dtype=float))
+    if quantiles.ndim != 1 or np.any((quantiles < 0) | (quantiles >= 1)):
+        raise ValueError("quantiles should be a 1-D grid of fractions in [0, 1)")
+
+    return quantiles, norm_ppf(quantiles)
+
+
+def confidence_labels(quantiles):
+    """Convert quantiles to cumulative confidence (%) of at least that capacity"""
+    labels = np.round(100 * (1 - np.asarray(quantiles, dtype=float)), 10)
+
+    # whole percentages keep the integer labels of the default grid
+    if np.all(labels == np.round(labels)):
+        return labels.astype(int)
+
+    return labels
+
+
+def lognormal_params(p90, p10):
+    """Calculate log-space mean and standard deviation of a lognormal from its P90 and P10
+
+    Args:
+        p90 (float or array): pessimistic value(s)
+        p10 (float or array): optimistic value(s)
+
+    Returns:
+        mu (ndarray): mean of the natural log
+        sigma (ndarray): standard deviation of the natural log
+    """
+    log_p90 = np.log(np.asarray(p90, dtype=float))
+    log_p10 = np.log(np.asarray(p10, dtype=float))
+
+    mu = (log_p90 + log_p10) / 2
+    sigma = (log_p10 - log_p90) / P90_P10_Z_SPAN
+
+    return mu, sigma
+
+
+def lognormal_partials(x, mu, sigma, upper: bool=False):
+    """Calculate the CDF and partial mean E[X; X <= x] of lognormals in closed form
+
+    A lognormal without spread (sigma 0) is a step at exp(mu).
+
+    Args:
+        x (float or array): values at which to evaluate, broadcast against mu and sigma
+        mu (float or array): mean of the natural log
+        sigma (float or array): standard deviation of the natural log
+        upper (bool): return the survival function and the upper partial mean E[X; X > x]
+            instead, which stay accurate far into the upper tail
+
+    Returns:
+        probability (ndarray): P(X <= x), or P(X > x) if upper
+        partial_mean (ndarray): E[X; X <= x], or E[X; X > x] if upper
+    """
+    mu = np.asarray(mu, dtype=float)
+    sigma = np.asarray(sigma, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_x = np.log(np.asarray(x, dtype=float))
+        d = np.where(sigma > 0, (log_x - mu) / sigma, np.where(log_x >= mu, np.inf, -np.inf))
+    mean = np.exp(mu + sigma**2 / 2)
+
+    if upper:
+        return norm_sf(d), mean * norm_sf(d - sigma)
+    return norm_cdf(d), mean * norm_cdf(d - sigma)
+
+
+def capacity_params(areaP90, areaP10, pdP90, pdP10, correlation=0.):
+    """Calculate log-space mean and standard deviation of capacity (area * power density)
 
-    # calculate powerdensity mean and standard dev
-    powerdens_mu = ((np.log(pdP90)+np.log(pdP10))/2)
-    powerdens_sigma = (np.log(pdP10)-np.log(pdP90))/((norm.ppf(0.9)-(norm.ppf(0.1))))
+    log capacity is the sum of two normals, so with a correlation rho between log area and
+    log power density its variance is area_sigma^2 + powerdens_sigma^2 + 2 rho area_sigma
+    powerdens_sigma and capacity stays exactly lognormal.
 
+    Args:
+        areaP90 (float or array): pessimistic area in sqkm
+        areaP10 (float or array): optimistic area in sqkm
+        pdP90 (float or array): pessimistic power density in MWe/sqkm
+        pdP10 (float or array): optimistic power density in MWe/sqkm
+        correlation (float or array): correlation of log area and log power density, -1 to 1
+
+    Returns:
+        capacity_mu (ndarray): mean of the natural log of capacity
+        capacity_sigma (ndarray): standard deviation of the natural log of capacity
+    """
+    area_mu, area_sigma = lognormal_params(areaP90, areaP10)
+    powerdens_mu, powerdens_sigma = lognormal_params(pdP90, pdP10)
+
+    correlation = np.asarray(correlation, dtype=float)
+    if np.any(np.abs(correlation) > 1):
+        raise ValueError("correlation should be between -1 and 1")
 
     capacity_mu = area_mu + powerdens_mu
-    capacity_sigma = ((area_sigma**2)+(powerdens_sigma**2))**0.5
-    eds = [lognorm.ppf(x/100, capacity_sigma, loc=0, scale=np.exp(capacity_mu)) for x in range(0,100)]
-    indx = list(np.arange(1,101)[::-1])
-    edsepc_tups = list(zip(indx,eds))
-    prob_df = pd.DataFrame(edsepc_tups, columns = ['Cumulative confidence (%)', 'expected development size (MW)'])
+    capacity_variance = area_sigma**2 + powerdens_sigma**2 + 2 * correlation * area_sigma * powerdens_sigma
+    # with a correlation of -1 and equal spreads the variance is 0 and may round to just below
+    capacity_sigma = np.sqrt(np.maximum(capacity_variance, 0))
+
+    return capacity_mu, capacity_sigma
+
+
+def _scenario_arrays(areaP90, areaP10, pdP90, pdP10):
+    """Convert scenario inputs to 1-D float arrays of equal length"""
+    inputs = [np.atleast_1d(np.asarray(x, dtype=float)) for x in (areaP90, areaP10, pdP90, pdP10)]
+    if any(x.ndim != 1 for x in inputs) or len({len(x) for x in inputs}) != 1:
+        raise ValueError("areaP90, areaP10, pdP90 and pdP10 should be 1-D and of the same length")
+
+    return inputs
+
+
+def calculate_cumulative_conf_batch(areaP90, areaP10, pdP90, pdP10, quantiles=None, as_frame: bool=False,
+                                    correlation=0., backend: str='auto'):
+    """Calculate cumulative confidence curves for many scenarios in one array operation
+
+    Equivalent to calling calculate_cumulative_conf once per scenario, but the lognormal
+    quantiles of every scenario are evaluated in a single broadcast in log space.
+
+    Args:
+        areaP90 (array or list): pessimistic area in sqkm
+        areaP10 (array or list): optimistic area in sqkm
+        pdP90 (array or list): pessimistic power density in MWe/sqkm
+        pdP10 (array or list): optimistic power density in MWe/sqkm
+        quantiles (array, optional): quantile grid as fractions in [0, 1). Defaults to CONF_GRID.
+        as_frame (bool): return a pandas DataFrame instead of an array
+        correlation (float or array): correlation of log area and log power density, -1 to 1,
+            for all scenarios or per scenario
+        backend (str): compute backend, 'auto' (NumPy or numba by batch size), 'numpy',
+            'numba' or the opt-in process pool 'process'; see power_backends
+
+    Returns:
+        eds (ndarray): expected development size in MW, shape (scenarios, quantiles), with
+            columns in the same order as the rows of calculate_cumulative_conf.
+            If as_frame is True, a DataFrame indexed by cumulative confidence (%)
+            with one column per scenario.
+    """
+    curves = capacity_curves(areaP90, areaP10, pdP90, pdP10, quantiles=quantiles, correlation=correlation,
+                             backend=backend)
+
+    if as_frame:
+        return curves.to_frame()
+
+    return curves.values
+
+
+class CapacityCurve(object):
+    """Cumulative confidence curve of one scenario, held as NumPy arrays
+
+    A DataFrame is only built when to_frame() is called.
+
+    :param quantiles: quantile grid as fractions
+    :param values: expected development size in MW at each quantile
+    :param mu: mean of the natural log of capacity
+    :param sigma: standard deviation of the natural log of capacity
+    """
+    __slots__ = ('quantiles', 'values', 'mu', 'sigma')
+
+    def __init__(self, quantiles, values, mu, sigma):
+        self.quantiles = quantiles
+        self.values = values
+        self.mu = mu
+        self.sigma = sigma
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return f'CapacityCurve(P90={self.P90:.4g}, P50={self.P50:.4g}, P10={self.P10:.4g} MW)'
+
+    @property
+    def P90(self):
+        """Pessimistic capacity in MW, 90% confidence of at least this size"""
+        return np.exp(self.mu + self.sigma * P_VALUES_Z[0])
+
+    @property
+    def P50(self):
+        return np.exp(self.mu + self.sigma * P_VALUES_Z[1])
+
+    @property
+    def P10(self):
+        """Optimistic capacity in MW, 10% confidence of at least this size"""
+        return np.exp(self.mu + self.sigma * P_VALUES_Z[2])
+
+    @property
+    def mean(self):
+        return np.exp(self.mu + self.sigma**2 / 2)
+
+    @property
+    def p10_p90_ratio(self):
+        """P10:P90 ratio, a single measure of the relative uncertainty range"""
+        return np.exp(self.sigma * (P_VALUES_Z[2] - P_VALUES_Z[0]))
+
+    def to_frame(self):
+        """Cumulative confidence curve in the layout of calculate_cumulative_conf"""
+        import pandas as pd
+        return pd.DataFrame({'Cumulative confidence (%)': confidence_labels(self.quantiles),
+                             'expected development size (MW)': self.values})
+
+
+class CapacityCurves(CapacityCurve):
+    """Cumulative confidence curves of many scenarios sharing one contiguous matrix
+
+    values has shape (scenarios, quantiles) and mu and sigma one entry per scenario, so
+    the P-value accessors return arrays. Indexing returns a CapacityCurve whose values
+    are a view into the shared matrix.
+    """
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.mu)
+
+    def __getitem__(self, i):
+        return CapacityCurve(self.quantiles, self.values[i], self.mu[i], self.sigma[i])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __repr__(self):
+        return f'CapacityCurves({len(self)} scenarios x {len(self.quantiles)} quantiles)'
+
+    def pvalues(self):
+        """P90, P50 and P10 capacity in MW, shape (scenarios, 3)"""
+        return np.exp(self.mu[:, None] + self.sigma[:, None] * P_VALUES_Z[None, :])
+
+    def to_frame(self):
+        """DataFrame indexed by cumulative confidence (%) with one column per scenario"""
+        import pandas as pd
+        prob_df = pd.DataFrame(self.values.T, index=confidence_labels(self.quantiles))
+        prob_df.index.name = 'Cumulative confidence (%)'
+        prob_df.columns.name = 'scenario'
+        return prob_df
+
+
+def capacity_curve(areaP90: float=1., areaP10: float=10., pdP90: float=10., pdP10: float=24, quantiles=None,
+                   correlation: float=0.):
+    """Calculate the cumulative confidence curve of one scenario as a CapacityCurve
+
+    Same values as calculate_cumulative_conf, without building a DataFrame.
+    """
+    quantiles, z = quantile_grid(quantiles)
+    capacity_mu, capacity_sigma = (float(x) for x in capacity_params(areaP90, areaP10, pdP90, pdP10, correlation))
+    eds = power_backends.quantile_matrix([capacity_mu], [capacity_sigma], z, backend='numpy')[0]
+
+    return CapacityCurve(quantiles, eds, capacity_mu, capacity_sigma)
+
+
+def capacity_curves(areaP90, areaP10, pdP90, pdP10, quantiles=None, correlation=0., backend: str='auto'):
+    """Calculate the cumulative confidence curves of many scenarios as one CapacityCurves
+
+    Same values as calculate_cumulative_conf_batch. backend selects the power_backends
+    engine, chosen by batch size by default.
+    """
+    quantiles, z = quantile_grid(quantiles)
+    inputs = _scenario_arrays(areaP90, areaP10, pdP90, pdP10)
+    capacity_mu, capacity_sigma = np.broadcast_arrays(*capacity_params(*inputs, correlation=correlation))
+
+    # (scenarios, 1) against (1, quantiles)
+    eds = power_backends.quantile_matrix(capacity_mu, capacity_sigma, z, backend=backend)
+
+    return CapacityCurves(quantiles, eds, capacity_mu, capacity_sigma)
+
+
+def capacity_pvalues(areaP90, areaP10, pdP90, pdP10, correlation=0.):
+    """Calculate the P90, P50 and P10 capacity in MW directly from the lognormal quantile function
+
+    Args:
+        areaP90 (float or array): pessimistic area in sqkm
+        areaP10 (float or array): optimistic area in sqkm
+        pdP90 (float or array): pessimistic power density in MWe/sqkm
+        pdP10 (float or array): optimistic power density in MWe/sqkm
+        correlation (float or array): correlation of log area and log power density, -1 to 1
+
+    Returns:
+        pvalues (ndarray): P90, P50 and P10 capacity in MW along the last axis
+    """
+    capacity_mu, capacity_sigma = capacity_params(areaP90, areaP10, pdP90, pdP10, correlation)
+
+    return np.exp(np.expand_dims(capacity_mu, -1) + np.expand_dims(capacity_sigma, -1) * P_VALUES_Z)
+
+
+def capacity_confidence(capacity, areaP90, areaP10, pdP90, pdP10, correlation=0.):
+    """Calculate the cumulative confidence (%) of at least the given capacity
+
+    This is the reverse of the confidence curve: the lognormal survival function of
+    capacity evaluated in closed form for many capacities at once.
+
+    Args:
+        capacity (float or array): development size(s) in MW to query
+        areaP90 (float or array): pessimistic area in sqkm
+        areaP10 (float or array): optimistic area in sqkm
+        pdP90 (float or array): pessimistic power density in MWe/sqkm
+        pdP10 (float or array): optimistic power density in MWe/sqkm
+        correlation (float or array): correlation of log area and log power density, -1 to 1
+
+    Returns:
+        confidence (ndarray): cumulative confidence (%). For a single scenario the shape
+            follows capacity; for many scenarios it is (scenarios, capacities).
+    """
+    capacity_mu, capacity_sigma = capacity_params(areaP90, areaP10, pdP90, pdP10, correlation)
+    with np.errstate(divide='ignore'):
+        log_capacity = np.log(np.asarray(capacity, dtype=float))
+
+    if np.ndim(capacity_mu) > 0:
+        capacity_mu = capacity_mu[..., None]
+        capacity_sigma = capacity_sigma[..., None]
 
-    return prob_df
\ No newline at end of file
+    return 100 * norm_cdf((capacity_mu - log_capacity) / capacity_sigma)
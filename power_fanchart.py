@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""Fan-chart reduction of many cumulative confidence curves for plotting
+
+A sweep of N curves is reduced to envelope bands, percentiles across scenarios of the
+capacity at each confidence level, plus at most max_curves representative scenarios
+spread evenly over the ranking of their P50. The plotting data then has a fixed size
+however large the sweep is. Large or memory-mapped curve matrices (power_store) are
+reduced a block of confidence levels at a time, so memory stays bounded.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import numpy as np
+import pandas as pd
+
+import power_dens
+
+PERCENTILES = (5, 25, 50, 75, 95)
+MAX_CURVES = 10
+
+# Curve values read at once when computing the bands
+BLOCK_VALUES = 2**25
+
+CONFIDENCE = 'Cumulative confidence (%)'
+CAPACITY = 'Expected development size (MWe)'
+
+
+def _matrix(curves):
+    """(scenarios, quantiles) matrix from an array, CapacityCurves, SweepStore or DataFrame
+
+    DataFrames are in the layout of add_scenarios and calculate_cumulative_conf_batch,
+    one column per scenario.
+    """
+    if isinstance(curves, pd.DataFrame):
+        curves = curves.to_numpy().T
+    elif hasattr(curves, 'curves'):
+        curves = curves.curves
+    elif isinstance(curves, power_dens.CapacityCurve):
+        curves = curves.values
+    curves = np.asanyarray(curves)
+    if curves.ndim != 2:
+        raise ValueError("curves should be a (scenarios, quantiles) matrix")
+    return curves
+
+
+def envelope(curves, percentiles=PERCENTILES):
+    """Percentiles across scenarios of the capacity at each confidence level
+
+    Args:
+        curves (array, CapacityCurves, SweepStore or DataFrame): (scenarios, quantiles) curves
+        percentiles (list): percentiles across scenarios, 0 - 100
+
+    Returns:
+        bands (ndarray): (percentiles, quantiles) capacity in MW; NaN curves are ignored
+    """
+    curves = _matrix(curves)
+    n, n_quantiles = curves.shape
+    block = max(1, BLOCK_VALUES // max(n, 1))
+
+    bands = np.full((len(percentiles), n_quantiles), np.nan)
+    if n == 0:
+        return bands
+    for start in range(0, n_quantiles, block):
+        # one contiguous row per confidence level partitions faster than strided columns
+        columns = np.ascontiguousarray(np.asarray(curves[:, start:start + block], dtype=float).T)
+        # nanpercentile is much slower, only needed when some curves failed
+        if np.isnan(columns).any():
+            bands[:, start:start + block] = np.nanpercentile(columns, percentiles, axis=1)
+        else:
+            bands[:, start:start + block] = np.percentile(columns, percentiles, axis=1)
+
+    return bands
+
+
+def representatives(curves, max_curves: int=MAX_CURVES, column=None):
+    """Scenarios spread evenly over the ranking of one confidence level, lowest to highest
+
+    Args:
+        curves (array, CapacityCurves, SweepStore or DataFrame): (scenarios, quantiles) curves
+        max_curves (int): most scenarios returned
+        column (int, optional): curve column used for the ranking, defaults to the middle
+            one (P50 on the default grid)
+
+    Returns:
+        rows (ndarray): row numbers of the representative scenarios
+    """
+    curves = _matrix(curves)
+    column = curves.shape[1] // 2 if column is None else column
+    values = np.asarray(curves[:, column], dtype=float)
+
+    order = np.argsort(values, kind='stable')
+    order = order[np.isfinite(values[order])]
+    if len(order) <= max_curves:
+        return order
+
+    return order[np.unique(np.linspace(0, len(order) - 1, max_curves).round().astype(int))]
+
+
+def fan_chart(curves, quantiles=None, percentiles=PERCENTILES, max_curves: int=MAX_CURVES, names=None):
+    """Long-form plotting data of envelope bands and representative curves
+
+    Args:
+        curves (array, CapacityCurves, SweepStore or DataFrame): (scenarios, quantiles) curves
+        quantiles (array, optional): quantile grid of the curves, taken from a
+            CapacityCurves or SweepStore and otherwise defaulting to power_dens.CONF_GRID
+        percentiles (list): envelope percentiles across scenarios
+        max_curves (int): most representative scenarios, 0 for none
+        names (list, optional): scenario names for the representative lines, by row
+
+    Returns:
+        fan_df (pandas Dataframe): one row per line and confidence level with the columns
+            'line' (e.g. 'P50 of scenarios' or 'scenario 12'), 'kind' ('band' or
+            'scenario'), cumulative confidence (%) and capacity; at most
+            (len(percentiles) + max_curves) * quantiles rows
+    """
+    if quantiles is None:
+        quantiles = getattr(curves, 'quantiles', None)
+    quantiles, _ = power_dens.quantile_grid(quantiles)
+    matrix = _matrix(curves)
+    if matrix.shape[1] != len(quantiles):
+        raise ValueError("curves and quantiles have different numbers of confidence levels")
+
+    lines = [f'P{p:g} of scenarios' for p in percentiles]
+    values = [envelope(matrix, percentiles)]
+    kinds = ['band'] * len(percentiles)
+    if max_curves:
+        rows = representatives(matrix, max_curves)
+        lines += [f'scenario {row}' if names is None else str(names[row]) for row in rows]
+        values.append(np.asarray(matrix[rows], dtype=float).reshape(len(rows), matrix.shape[1]))
+        kinds += ['scenario'] * len(rows)
+    values = np.concatenate(values)
+
+    labels = power_dens.confidence_labels(quantiles)
+    fan_df = pd.DataFrame({'line': np.repeat(lines, len(labels)),
+                           'kind': np.repeat(kinds, len(labels)),
+                           CONFIDENCE: np.tile(labels, len(lines)),
+                           CAPACITY: values.ravel()})
+
+    return fan_df
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""Goal seek: the area or power density needed for a target capacity at a given confidence
+
+Answers screening questions in reverse, e.g. "what P90 area gives 90% confidence of at
+least 30 MWe with this power density range?". Targets are capacities in MWe at
+cumulative confidence levels in percent, as returned by power_dens.capacity_confidence,
+and every argument broadcasts, so whole arrays of targets and prospects are solved at once.
+
+- solve_scale: factor on both P90 and P10 of area or power density. Scaling an input
+  only shifts mu, so this is closed form.
+- solve_range: P90 and P10 of area or power density that meet two targets at once,
+  closed form from the two resulting equations for mu and sigma.
+- solve_input: one input bound with the other three fixed, a vectorized bisection in log
+  space. Between 90% and 10% confidence capacity quantiles increase with every log input;
+  beyond that they can turn, and the search is split at the analytic turning point.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import numpy as np
+
+import power_dens
+
+INPUT_NAMES = ['areaP90', 'areaP10', 'pdP90', 'pdP10']
+
+# Bisection interval below (for P90) or above (for P10) the fixed bound, in natural log units
+SEARCH_SPAN = 40.
+TOLERANCE = 1e-12
+
+
+def _z(confidence):
+    """Standard normal z-value of a cumulative confidence (%) of at least a capacity"""
+    confidence = np.asarray(confidence, dtype=float)
+    if np.any((confidence <= 0) | (confidence >= 100)):
+        raise ValueError("confidence should be a percentage between 0 and 100 (exclusive)")
+    return power_dens.norm_ppf(1 - confidence / 100)
+
+
+def _log_quantile(z, log_inputs, correlation):
+    """ln capacity at z from the log inputs areaP90, areaP10, pdP90, pdP10"""
+    capacity_mu, capacity_sigma = power_dens.capacity_params(*[np.exp(x) for x in log_inputs],
+                                                             correlation=correlation)
+    return capacity_mu + capacity_sigma * z
+
+
+def solve_scale(target, confidence, areaP90, areaP10, pdP90, pdP10, which: str='area', correlation=0.):
+    """Factor on the P90 and P10 of area or power density that meets a target exactly
+
+    Args:
+        target (float or array): capacity in MWe to reach
+        confidence (float or array): cumulative confidence (%) of at least the target, e.g. 90
+        areaP90, areaP10, pdP90, pdP10 (float or array): current inputs
+        which (str): 'area' or 'power_density', the input to scale
+        correlation (float or array): correlation of log area and log power density
+
+    Returns:
+        factor (ndarray): multiply the chosen P90 and P10 by this factor
+        p90, p10 (ndarray): the scaled P90 and P10
+    """
+    if which not in ('area', 'power_density'):
+        raise ValueError("which should be 'area' or 'power_density'")
+
+    z = _z(confidence)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        capacity_mu, capacity_sigma = power_dens.capacity_params(areaP90, areaP10, pdP90, pdP10, correlation)
+        factor = np.exp(np.log(np.asarray(target, dtype=float)) - capacity_mu - capacity_sigma * z)
+
+    if which == 'area':
+        return factor, factor * np.asarray(areaP90, dtype=float), factor * np.asarray(areaP10, dtype=float)
+    return factor, factor * np.asarray(pdP90, dtype=float), factor * np.asarray(pdP10, dtype=float)
+
+
+def solve_range(target_low, confidence_low, target_high, confidence_high, which: str='area',
+                areaP90=None, areaP10=None, pdP90=None, pdP10=None, correlation=0.):
+    """P90 and P10 of area or power density that meet two targets, the other input fixed
+
+    Two targets fix the capacity mu and sigma: sigma = (ln C_high - ln C_low) / (z_high - z_low).
+    The chosen input's sigma follows from sigma^2 = s^2 + 2 rho s s_other + s_other^2 and
+    its mu from mu = mu_area + mu_pd.
+
+    Args:
+        target_low (float or array): capacity in MWe at the higher confidence, e.g. 30 at 90%
+        confidence_low (float or array): cumulative confidence (%) of target_low
+        target_high (float or array): capacity in MWe at the lower confidence, e.g. 150 at 10%
+        confidence_high (float or array): cumulative confidence (%) of target_high
+        which (str): 'area' or 'power_density', the input to solve for
+        areaP90, areaP10 or pdP90, pdP10 (float or array): the other, fixed input
+        correlation (float or array): correlation of log area and log power density
+
+    Returns:
+        p90, p10 (ndarray): required P90 and P10 of the chosen input, NaN where no range
+            can meet both targets (the fixed input alone is already too uncertain)
+    """
+    if which == 'area':
+        other90, other10 = pdP90, pdP10
+    elif which == 'power_density':
+        other90, other10 = areaP90, areaP10
+    else:
+        raise ValueError("which should be 'area' or 'power_density'")
+    if other90 is None or other10 is None:
+        raise ValueError("the P90 and P10 of the other input are required")
+
+    z_low, z_high = _z(confidence_low), _z(confidence_high)
+    if np.any(z_high <= z_low):
+        raise ValueError("confidence_high should be below confidence_low")
+    correlation = np.asarray(correlation, dtype=float)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_low = np.log(np.asarray(target_low, dtype=float))
+        log_high = np.log(np.asarray(target_high, dtype=float))
+        capacity_sigma = (log_high - log_low) / (z_high - z_low)
+        capacity_mu = log_low - capacity_sigma * z_low
+
+        other_mu, other_sigma = power_dens.lognormal_params(other90, other10)
+        # positive root of s^2 + 2 rho s_other s + s_other^2 - sigma^2 = 0
+        sigma = -correlation * other_sigma + np.sqrt(capacity_sigma**2 - (1 - correlation**2) * other_sigma**2)
+        sigma = np.where(sigma >= 0, sigma, np.nan)
+        mu = capacity_mu - other_mu
+
+    half_span = sigma * power_dens.P90_P10_Z_SPAN / 2
+    return np.exp(mu - half_span), np.exp(mu + half_span)
+
+
+def solve_input(target, confidence, name: str, areaP90=None, areaP10=None, pdP90=None, pdP10=None,
+                correlation=0., iterations: int=200):
+    """One input bound that meets a target exactly, the other three inputs fixed
+
+    A P90 input is searched below its P10 and a P10 input above its P90, so the solved
+    range stays ordered. Within 90% to 10% confidence the capacity quantile increases
+    with every input. Beyond it, widening a range can lower the quantile again (e.g. the
+    95% capacity eventually falls as areaP10 grows), so the quantile first rises and then
+    falls, or the reverse. The search is then split at the analytic turning point, and
+    where two values meet the target the one closer to the fixed partner bound, i.e. the
+    narrower range, is returned.
+
+    Args:
+        target (float or array): capacity in MWe to reach
+        confidence (float or array): cumulative confidence (%) of at least the target
+        name (str): input to solve for, one of areaP90, areaP10, pdP90, pdP10; its own
+            argument is ignored
+        areaP90, areaP10, pdP90, pdP10 (float or array): the fixed inputs
+        correlation (float or array): correlation of log area and log power density
+        iterations (int): most bisection steps; stops earlier at TOLERANCE in log space
+
+    Returns:
+        value (ndarray): required input, NaN where the target cannot be met with an
+            ordered range (e.g. too high even with no uncertainty in that input)
+    """
+    if name not in INPUT_NAMES:
+        raise ValueError(f"name should be one of {INPUT_NAMES}")
+    k = INPUT_NAMES.index(name)
+    inputs = dict(zip(INPUT_NAMES, (areaP90, areaP10, pdP90, pdP10)))
+    inputs[name] = 1.
+    if any(value is None for value in inputs.values()):
+        raise ValueError("the other three inputs are required")
+
+    z = _z(confidence)
+    correlation = np.asarray(correlation, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_target = np.log(np.asarray(target, dtype=float))
+        log_inputs = np.broadcast_arrays(log_target, z, correlation,
+                                         *[np.log(np.asarray(inputs[n], dtype=float)) for n in INPUT_NAMES])
+    log_target, z, correlation = log_inputs[:3]
+    log_inputs = [x.copy() for x in log_inputs[3:]]
+
+    # the partner bound of the same input limits the search; direction is +1 for P10, -1 for P90
+    partner = log_inputs[k + 1 if k % 2 == 0 else k - 1]
+    direction = -1 if k % 2 == 0 else 1
+    far = partner + direction * SEARCH_SPAN
+
+    # turning point of ln Q = x / 2 + z sigma(s) in the spread s of the solved input, where
+    # (s + rho s_other) / sigma = -span / (2 z direction); none when that ratio is not below 1
+    other = 2 if k < 2 else 0
+    _, other_sigma = power_dens.lognormal_params(np.exp(log_inputs[other]), np.exp(log_inputs[other + 1]))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = -power_dens.P90_P10_Z_SPAN / (2 * z * direction)
+        u = np.sign(ratio) * np.sqrt(ratio**2 * (1 - correlation**2) * other_sigma**2 / (1 - ratio**2))
+    turn = np.where(np.abs(ratio) < 1, np.clip(u - correlation * other_sigma, 0, SEARCH_SPAN / power_dens.P90_P10_Z_SPAN), 0.)
+    turn = partner + direction * turn * power_dens.P90_P10_Z_SPAN
+
+    def residual(x):
+        log_inputs[k] = x
+        return _log_quantile(z, log_inputs, correlation) - log_target
+
+    # the root is bracketed where the ends differ in sign; try the branch next to the partner first
+    r_partner, r_turn, r_far = residual(partner), residual(turn), residual(far)
+    near = np.sign(r_partner) * np.sign(r_turn) <= 0
+    feasible = near | (np.sign(r_turn) * np.sign(r_far) <= 0)
+    low = np.where(near, partner, turn)
+    high = np.where(near, turn, far)
+    r_low = np.where(near, r_partner, r_turn)
+
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        same = np.sign(residual(middle)) == np.sign(r_low)
+        low = np.where(same, middle, low)
+        high = np.where(same, high, middle)
+        if np.nanmax(np.abs(high - low), initial=0.) < TOLERANCE:
+            break
+
+    return np.where(feasible, np.exp((low + high) / 2), np.nan)
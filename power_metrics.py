@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""Instrumentation sinks for the capacity calculations
+
+Instrumented code emits plain dictionaries: per-stage timings
+({'event': 'stage', 'stage': ..., 'seconds': ...}), scenario counts
+({'event': 'count', 'processed': ..., 'failed': ...}) and failures
+({'event': 'failure', 'scenario': ..., 'reason': ...}). Where they go is decided by the
+sink passed in: the logging module, any callback, or an in-memory collector.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class LoggingSink(object):
+    """Send events to a logger
+
+    :param logger: logging.Logger, defaults to the 'powerdensity' logger
+    :param level: logging level of the records
+    """
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger('powerdensity')
+        self.level = level
+
+    def emit(self, event):
+        self.logger.log(self.level, '%s', event)
+
+
+class CallbackSink(object):
+    """Pass every event to a callable
+
+    :param callback: function taking the event dictionary
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def emit(self, event):
+        self.callback(event)
+
+
+class CollectorSink(object):
+    """Keep events in memory and summarize them"""
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event):
+        self.events.append(event)
+
+    def stage_seconds(self):
+        """Total seconds per stage"""
+        totals = defaultdict(float)
+        for event in self.events:
+            if event['event'] == 'stage':
+                totals[event['stage']] += event['seconds']
+        return dict(totals)
+
+    def counts(self):
+        """Total scenarios processed and failed"""
+        totals = {'processed': 0, 'failed': 0}
+        for event in self.events:
+            if event['event'] == 'count':
+                totals['processed'] += event['processed']
+                totals['failed'] += event['failed']
+        return totals
+
+    def failures(self):
+        """(scenario, reason) of every failure"""
+        return [(event['scenario'], event['reason']) for event in self.events if event['event'] == 'failure']
+
+    def clear(self):
+        self.events = []
+
+
+class Instrumentation(object):
+    """Emit events to a sink; does nothing when the sink is None
+
+    :param sink: any object with an emit(event) method, or None
+    """
+
+    def __init__(self, sink=None):
+        self.sink = sink
+
+    def __bool__(self):
+        return self.sink is not None
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """Time the enclosed block as one stage"""
+        if self.sink is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sink.emit({'event': 'stage', 'stage': name, 'seconds': time.perf_counter() - start, **fields})
+
+    def count(self, processed, failed=0, **fields):
+        if self.sink is not None:
+            self.sink.emit({'event': 'count', 'processed': int(processed), 'failed': int(failed), **fields})
+
+    def failure(self, scenario, reason, **fields):
+        if self.sink is not None:
+            self.sink.emit({'event': 'failure', 'scenario': scenario, 'reason': reason, **fields})
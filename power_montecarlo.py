@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+"""Monte Carlo estimate of the cumulative confidence curve for capacity
+
+Capacity is sampled as the product of independent input factors (area, power density
+and optionally others such as a recovery factor), each drawn from a lognormal,
+triangular or uniform distribution. Samples are drawn in fixed-size chunks and only a
+log-spaced histogram of capacity is kept, so memory does not grow with the number of
+samples. Chunks can be spread over a process pool; every chunk gets its own seed
+spawned from the master seed, so results do not depend on the number of workers.
+
+Area and power density can also be correlated through a Gaussian copula: both are
+drawn from correlated standard normals and mapped through their own quantile function.
+For lognormal inputs this is the case power_dens handles in closed form with its
+correlation option, so the sampler serves as a check of it.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import power_dens
+
+
+class Lognormal(object):
+    """Lognormal input defined by its P90 (pessimistic) and P10 (optimistic) values"""
+
+    def __init__(self, p90: float, p10: float):
+        self.p90 = float(p90)
+        self.p10 = float(p10)
+        self.mu, self.sigma = (float(x) for x in power_dens.lognormal_params(p90, p10))
+
+    def sample(self, rng, size):
+        return rng.lognormal(self.mu, self.sigma, size)
+
+    def from_normal(self, z):
+        """Map standard normal draws to this input through its quantile function"""
+        return np.exp(self.mu + self.sigma * z)
+
+    def bounds(self):
+        # +/- 8 sigma leaves ~1e-15 of the probability outside the histogram
+        return np.exp(self.mu - 8 * self.sigma), np.exp(self.mu + 8 * self.sigma)
+
+
+class Triangular(object):
+    """Triangular input defined by its minimum, most likely and maximum values"""
+
+    def __init__(self, low: float, mode: float, high: float):
+        if not low <= mode <= high:
+            raise ValueError("triangular input expects low <= mode <= high")
+        self.low = float(low)
+        self.mode = float(mode)
+        self.high = float(high)
+
+    def sample(self, rng, size):
+        return rng.triangular(self.low, self.mode, self.high, size)
+
+    def from_normal(self, z):
+        """Map standard normal draws to this input through its quantile function"""
+        u = power_dens.norm_cdf(z)
+        span = self.high - self.low
+        split = (self.mode - self.low) / span if span > 0 else 0.
+        return np.where(u < split,
+                        self.low + np.sqrt(u * span * (self.mode - self.low)),
+                        self.high - np.sqrt((1 - u) * span * (self.high - self.mode)))
+
+    def bounds(self):
+        return _positive_bounds(self.low, self.high)
+
+
+class Uniform(object):
+    """Uniform (rectangular) input defined by its minimum and maximum values"""
+
+    def __init__(self, low: float, high: float):
+        if not low <= high:
+            raise ValueError("uniform input expects low <= high")
+        self.low = float(low)
+        self.high = float(high)
+
+    def sample(self, rng, size):
+        return rng.uniform(self.low, self.high, size)
+
+    def from_normal(self, z):
+        """Map standard normal draws to this input through its quantile function"""
+        return self.low + power_dens.norm_cdf(z) * (self.high - self.low)
+
+    def bounds(self):
+        return _positive_bounds(self.low, self.high)
+
+
+def _positive_bounds(low, high):
+    """Histogram bounds for an input that may reach zero"""
+    if high <= 0:
+        raise ValueError("input distributions must have a positive upper bound")
+    return max(low, high * 1e-6), high
+
+
+class CapacityHistogram(object):
+    """Streaming histogram of capacity on a fixed log-spaced grid
+
+    Args:
+        low (float): lower edge of the grid in MW
+        high (float): upper edge of the grid in MW
+        bins (int): number of log-spaced bins between low and high
+    """
+
+    def __init__(self, low: float, high: float, bins: int=2**14):
+        self.log_low = np.log(low)
+        self.log_high = np.log(high)
+        self.bins = int(bins)
+        self.width = (self.log_high - self.log_low) / self.bins
+        # one extra bin each side for values outside [low, high)
+        self.counts = np.zeros(self.bins + 2, dtype=np.int64)
+        self.total = 0.
+        self.total_sq = 0.
+
+    def update(self, values):
+        """Add a chunk of capacity samples to the histogram"""
+        with np.errstate(divide='ignore'):
+            idx = np.floor((np.log(values) - self.log_low) / self.width)
+        idx = np.clip(idx, -1, self.bins).astype(np.int64) + 1
+        self.counts += np.bincount(idx, minlength=self.bins + 2)
+        self.total += values.sum()
+        self.total_sq += np.square(values).sum()
+
+    def merge(self, other):
+        """Add the counts of another histogram on the same grid"""
+        self.counts += other.counts
+        self.total += other.total
+        self.total_sq += other.total_sq
+
+    @property
+    def n(self):
+        return int(self.counts.sum())
+
+    @property
+    def mean(self):
+        return self.total / self.n
+
+    @property
+    def std(self):
+        return np.sqrt(max(self.total_sq / self.n - self.mean**2, 0.))
+
+    def quantile(self, quantiles):
+        """Interpolate capacity quantiles in log space from the cumulative counts
+
+        Quantiles that fall in the under/overflow bins are returned at the grid edges.
+        """
+        quantiles = np.asarray(quantiles, dtype=float)
+        cumulative = np.cumsum(self.counts) / self.n
+        edges = self.log_low + self.width * np.arange(-1, self.bins + 2)
+        edges[0], edges[-1] = self.log_low, self.log_high
+
+        # bin containing each quantile, then linear position inside it
+        idx = np.clip(np.searchsorted(cumulative, quantiles, side='right'), 0, self.bins + 1)
+        below = np.where(idx > 0, cumulative[idx - 1], 0.)
+        inside = np.where(self.counts[idx] > 0, (quantiles - below) * self.n / np.maximum(self.counts[idx], 1), 0.)
+
+        return np.exp(edges[idx] + np.clip(inside, 0, 1) * (edges[idx + 1] - edges[idx]))
+
+
+def _sample_chunk(factors, size, seed, low, high, bins, correlation=0.):
+    """Draw one chunk of capacity samples and return its histogram"""
+    rng = np.random.default_rng(seed)
+
+    capacity = np.ones(size)
+    if correlation:
+        # Gaussian copula between the first two factors
+        z = rng.standard_normal((2, size))
+        z[1] = correlation * z[0] + np.sqrt(1 - correlation**2) * z[1]
+        capacity *= factors[0].from_normal(z[0]) * factors[1].from_normal(z[1])
+        factors = factors[2:]
+    for factor in factors:
+        capacity *= factor.sample(rng, size)
+
+    histogram = CapacityHistogram(low, high, bins)
+    histogram.update(capacity)
+
+    return histogram
+
+
+def monte_carlo_histogram(factors,
+                          n_samples: int=10**6,
+                          chunk_size: int=10**6,
+                          seed: int=0,
+                          n_jobs: int=1,
+                          bins: int=2**14,
+                          correlation: float=0.):
+    """Sample capacity as the product of the input factors into a streaming histogram
+
+    Args:
+        factors (list): input distributions (Lognormal, Triangular, Uniform) multiplied together
+        n_samples (int): total number of samples
+        chunk_size (int): samples drawn per chunk; bounds peak memory
+        seed (int): master seed, spawned into one independent seed per chunk
+        n_jobs (int): number of worker processes, 1 runs in this process
+        bins (int): number of log-spaced histogram bins
+        correlation (float): correlation of the normal scores of the first two factors
+            (Gaussian copula), -1 to 1
+
+    Returns:
+        histogram (CapacityHistogram): merged histogram of all samples
+    """
+    if not factors:
+        raise ValueError("at least one input factor is required")
+    if not -1 <= correlation <= 1:
+        raise ValueError("correlation should be between -1 and 1")
+    if correlation and len(factors) < 2:
+        raise ValueError("correlation needs at least two input factors")
+
+    # grid spanning every possible product of the inputs
+    bounds = np.array([factor.bounds() for factor in factors])
+    low, high = np.prod(bounds[:, 0]), np.prod(bounds[:, 1])
+
+    sizes = [chunk_size] * (n_samples // chunk_size)
+    if n_samples % chunk_size:
+        sizes.append(n_samples % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    histogram = CapacityHistogram(low, high, bins)
+    args = [(factors, size, chunk_seed, low, high, bins, correlation) for size, chunk_seed in zip(sizes, seeds)]
+
+    if n_jobs == 1:
+        for chunk in args:
+            histogram.merge(_sample_chunk(*chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            for chunk_histogram in executor.map(_sample_chunk, *zip(*args)):
+                histogram.merge(chunk_histogram)
+
+    return histogram
+
+
+def monte_carlo_cumulative_conf(areaP90: float=1., areaP10: float=10., pdP90: float=10., pdP10: float=24,
+                                area=None, power_density=None, extra_factors=(), quantiles=None,
+                                n_samples: int=10**6, chunk_size: int=10**6, seed: int=0, n_jobs: int=1,
+                                bins: int=2**14, correlation: float=0.):
+    """Monte Carlo cumulative confidence level for expected development size in MW
+
+    By default area and power density are lognormal from their P90/P10, which reproduces
+    power_dens.calculate_cumulative_conf within sampling error. Either input can be
+    replaced by any other distribution and further factors can be multiplied in. With a
+    correlation and lognormal inputs it reproduces power_dens.calculate_cumulative_conf
+    with the same correlation.
+
+    Args:
+        areaP90 (float): pessimistic area in sqkm
+        areaP10 (float): optimistic area in sqkm
+        pdP90 (float): pessimistic power density in MWe/sqkm
+        pdP10 (float): optimistic power density in MWe/sqkm
+        area (distribution, optional): area distribution, overrides areaP90/areaP10
+        power_density (distribution, optional): power density distribution, overrides pdP90/pdP10
+        extra_factors (list): further distributions multiplied into capacity, e.g. a recovery factor
+        quantiles (array, optional): quantile grid as fractions in [0, 1). Defaults to power_dens.CONF_GRID.
+        n_samples, chunk_size, seed, n_jobs, bins: see monte_carlo_histogram
+        correlation (float): correlation of area and power density normal scores, -1 to 1
+
+    Returns:
+        prob_df (pandas Dataframe): cumulative confidence curve in Reservoir Size, in the
+            same layout as power_dens.calculate_cumulative_conf
+    """
+    area = area if area is not None else Lognormal(areaP90, areaP10)
+    power_density = power_density if power_density is not None else Lognormal(pdP90, pdP10)
+
+    histogram = monte_carlo_histogram([area, power_density, *extra_factors],
+                                      n_samples=n_samples, chunk_size=chunk_size, seed=seed,
+                                      n_jobs=n_jobs, bins=bins, correlation=correlation)
+
+    quantiles, _ = power_dens.quantile_grid(quantiles)
+    eds = histogram.quantile(quantiles)
+
+    indx = power_dens.confidence_labels(quantiles)
+    prob_df = pd.DataFrame({'Cumulative confidence (%)': indx, 'expected development size (MW)': eds})
+
+    return prob_df
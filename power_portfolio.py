@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+"""Distribution of total risked capacity over a portfolio of prospects
+
+Each prospect contributes its lognormal capacity with the probability of exploration
+success (POS) and nothing otherwise, so the portfolio total is a sum of independent
+Bernoulli-gated lognormals. Two fast evaluations are provided:
+
+- portfolio_fft discretizes every prospect on one shared linear capacity grid, keeping
+  its mean exactly, and multiplies their Fourier transforms, which is the convolution
+  of all of them.
+- portfolio_moments matches the exact mean, variance and skewness of the total to a
+  shifted lognormal, in closed form.
+
+portfolio_monte_carlo samples the total directly and is only meant to validate the two.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import numpy as np
+import pandas as pd
+
+import power_dens
+
+# Grid step of portfolio_fft as a fraction of the typical prospect standard deviation
+RESOLUTION = 0.25
+MIN_BINS = 2**12
+MAX_BINS = 2**16
+
+# Prospects are discretized up to exp(mu + TAIL_Z sigma); the rest of their mass goes to that node
+TAIL_Z = 6.
+# Probability of single prospects exceeding the window of portfolio_fft
+TAIL_MASS = 1e-9
+
+
+def portfolio_params(pos, areaP90, areaP10, pdP90, pdP10):
+    """Convert per-prospect POS and P90/P10 inputs to arrays of POS, capacity mu and sigma
+
+    Args:
+        pos (array): probability of exploration success per prospect, as fractions
+        areaP90, areaP10 (array): pessimistic and optimistic area in sqkm
+        pdP90, pdP10 (array): pessimistic and optimistic power density in MWe/sqkm
+
+    Returns:
+        pos, capacity_mu, capacity_sigma (ndarray): 1-D arrays of equal length
+    """
+    inputs = power_dens._scenario_arrays(areaP90, areaP10, pdP90, pdP10)
+    capacity_mu, capacity_sigma = power_dens.capacity_params(*inputs)
+    pos = np.broadcast_to(np.asarray(pos, dtype=float), capacity_mu.shape)
+
+    if np.any((pos < 0) | (pos > 1)):
+        raise ValueError("pos should be fractions between 0 and 1")
+
+    return pos, capacity_mu, capacity_sigma
+
+
+def portfolio_cumulants(pos, capacity_mu, capacity_sigma):
+    """Exact mean, variance and third central moment of total risked capacity
+
+    Uses the raw moments of a Bernoulli-gated lognormal, E[X^k] = pos * exp(k mu + k^2 sigma^2 / 2),
+    and adds cumulants over the independent prospects.
+    """
+    pos, capacity_mu, capacity_sigma = (np.asarray(x, dtype=float) for x in (pos, capacity_mu, capacity_sigma))
+    m1, m2, m3 = (pos * np.exp(k * capacity_mu + k**2 * capacity_sigma**2 / 2) for k in (1, 2, 3))
+
+    mean = m1.sum()
+    variance = (m2 - m1**2).sum()
+    third = (m3 - 3 * m2 * m1 + 2 * m1**3).sum()
+
+    return mean, variance, third
+
+
+class PortfolioDistribution(object):
+    """Discrete distribution of total risked capacity on a linear grid
+
+    :param capacity: evenly spaced grid of total capacity in MWe; when it starts at 0
+        its first value is the atom of no successes
+    :param pmf: probability of each grid value
+    """
+
+    def __init__(self, capacity, pmf):
+        self.capacity = capacity
+        self.pmf = pmf
+        self.cdf = np.cumsum(pmf)
+
+    @property
+    def p_zero(self):
+        """Probability that no prospect succeeds (to grid resolution)"""
+        return self.pmf[0] if self.capacity[0] == 0 else 0.
+
+    @property
+    def mean(self):
+        return float(self.capacity @ self.pmf)
+
+    def quantile(self, quantiles):
+        """Total capacity at the given quantiles, interpolated between grid values"""
+        quantiles = np.asarray(quantiles, dtype=float)
+        idx = np.clip(np.searchsorted(self.cdf, quantiles, side='left'), 0, len(self.cdf) - 1)
+        below = np.where(idx > 0, self.cdf[idx - 1], 0.)
+        fraction = np.where(self.pmf[idx] > 0, (quantiles - below) / np.maximum(self.pmf[idx], 1e-300), 0.)
+        step = self.capacity[1] - self.capacity[0] if len(self.capacity) > 1 else 0.
+
+        # the first grid value at zero is an atom (no successes), not a bin to interpolate over
+        atom = (idx == 0) & (self.capacity[0] == 0)
+        return np.where(atom, 0., self.capacity[idx] + (np.clip(fraction, 0, 1) - 0.5) * step)
+
+    def cumulative_conf(self, quantiles=None):
+        """Cumulative confidence curve in the layout of power_dens.calculate_cumulative_conf"""
+        quantiles, _ = power_dens.quantile_grid(quantiles)
+        return _conf_frame(quantiles, self.quantile(quantiles))
+
+
+def _conf_frame(quantiles, eds):
+    indx = power_dens.confidence_labels(quantiles)
+    return pd.DataFrame({'Cumulative confidence (%)': indx, 'expected development size (MW)': eds})
+
+
+def portfolio_fft(pos, capacity_mu, capacity_sigma, bins: int=None, block: int=256, tail_sd: float=10.):
+    """Distribution of total risked capacity by FFT convolution on a shared grid
+
+    Each prospect is discretized on grid nodes with a mean-preserving linear allocation:
+    the probability of every cell between two nodes is split between them so that the
+    cell's mass and mean are both kept, so the mean total is exact and the variance is
+    only inflated by a small fraction of a step squared per prospect. The grid step is a
+    fraction (RESOLUTION) of the typical prospect standard deviation. The convolution is
+    circular over a window around the mean total, so only the window needs grid nodes.
+
+    Args:
+        pos (array): probability of exploration success per prospect
+        capacity_mu (array): mean of the natural log of capacity per prospect
+        capacity_sigma (array): standard deviation of the natural log of capacity per prospect
+        bins (int, optional): grid size over the window, a power of two keeps the FFT fast;
+            by default the smallest power of two giving the RESOLUTION step, at most MAX_BINS
+        block (int): prospects discretized at once, bounds memory to block * bins values
+        tail_sd (float): the window extends tail_sd standard deviations either side of the
+            mean total, and further up while single prospects could exceed it
+
+    Returns:
+        distribution (PortfolioDistribution): pmf of total capacity
+    """
+    pos, capacity_mu, capacity_sigma = (np.atleast_1d(np.asarray(x, dtype=float))
+                                        for x in (pos, capacity_mu, capacity_sigma))
+
+    # window of the total wide enough that wrap-around of the circular convolution is negligible:
+    # tail_sd either side of the mean, widened until no single prospect alone leaves it
+    mean, variance, _ = portfolio_cumulants(pos, capacity_mu, capacity_sigma)
+    variance = max(variance, 0.)
+    if variance <= (1e-12 * mean)**2:
+        # no spread (no chance of success, or certain prospects with P90 = P10): a point mass
+        return PortfolioDistribution(np.array([mean]), np.array([1.]))
+    cutoff = np.exp(capacity_mu + TAIL_Z * capacity_sigma)
+    lower = max(mean - tail_sd * np.sqrt(variance), 0.)
+    upper = mean + tail_sd * np.sqrt(variance)
+    with np.errstate(divide='ignore'):
+        while np.sum(pos * power_dens.norm_sf((np.log(upper - lower) - capacity_mu) / capacity_sigma)) > TAIL_MASS:
+            upper += upper - lower
+
+    if bins is None:
+        success_variance = np.exp(2 * capacity_mu + capacity_sigma**2) * np.expm1(capacity_sigma**2)
+        step = RESOLUTION * np.sqrt(np.average(success_variance, weights=pos + 1e-300))
+        # prospects without their own spread only need the window resolved
+        bins = int(2**np.ceil(np.log2(max((upper - lower) / step, 2.)))) if step > 0 else MIN_BINS
+        bins = min(max(bins, MIN_BINS), MAX_BINS)
+    step = (upper - lower) / (bins - 1)
+    first = int(lower // step)
+
+    # prospects with similar support discretized together, each on nodes 0 .. its cutoff
+    order = np.argsort(cutoff, kind='stable')
+    spectrum = np.ones(bins // 2 + 1, dtype=complex)
+    for start in range(0, len(pos), block):
+        rows = order[start:start + block]
+        p, mu, sigma = pos[rows, None], capacity_mu[rows, None], capacity_sigma[rows, None]
+        nodes = int(np.ceil(min(cutoff[rows].max(), upper) / step)) + 1
+
+        cdf, partial = power_dens.lognormal_partials(step * np.arange(nodes), mu, sigma)
+        mass = np.diff(cdf, axis=1)
+        # share of each cell's mass moved to its upper node, from the cell's mean
+        upper_share = np.clip(np.diff(partial, axis=1) / step - np.arange(nodes - 1) * mass, 0, mass)
+
+        pmf = np.zeros((len(rows), nodes))
+        pmf[:, :-1] += mass - upper_share
+        pmf[:, 1:] += upper_share
+        pmf[:, -1] += 1 - cdf[:, -1]
+        pmf *= p
+        pmf[:, 0] += 1 - p[:, 0]
+
+        # fold the nodes onto the circular grid: node k lands in bin k mod bins
+        pmf = np.pad(pmf, ((0, 0), (0, -nodes % bins))).reshape(len(rows), -1, bins).sum(axis=1)
+        spectrum *= np.prod(np.fft.rfft(pmf, axis=1), axis=0)
+
+    # the total lies in the window, so bin j is the node first + j
+    pmf = np.roll(np.fft.irfft(spectrum, n=bins), -first).clip(0)
+    capacity = step * (first + np.arange(bins))
+
+    return PortfolioDistribution(capacity, pmf / pmf.sum())
+
+
+def portfolio_moments(pos, capacity_mu, capacity_sigma):
+    """Shifted lognormal matched to the mean, variance and skewness of total risked capacity
+
+    Returns:
+        shift (float): location in MWe
+        mu (float): mean of the natural log of (total - shift)
+        sigma (float): standard deviation of the natural log of (total - shift).
+            Zero when the total is not right-skewed; shift and exp(mu) are then the mean
+            and standard deviation of a normal approximation.
+    """
+    mean, variance, third = portfolio_cumulants(pos, capacity_mu, capacity_sigma)
+    variance = max(variance, 0.)
+    if variance <= (1e-12 * mean)**2:
+        # no spread at all: a point mass at the mean, exp(mu) = 0
+        return mean, -np.inf, 0.
+    skew = third / variance**1.5
+
+    if skew <= 1e-6:
+        return mean, np.log(np.sqrt(variance)), 0.
+
+    # lognormal skewness (w + 2) sqrt(w - 1) with t = sqrt(w - 1) solves t^3 + 3t - skew = 0
+    root = np.sqrt(skew**2 / 4 + 1)
+    t = np.cbrt(skew / 2 + root) + np.cbrt(skew / 2 - root)
+    w = 1 + t**2
+
+    sigma = np.sqrt(np.log(w))
+    scale = np.sqrt(variance / (w * (w - 1)))
+    shift = mean - scale * np.sqrt(w)
+
+    return shift, np.log(scale), sigma
+
+
+def portfolio_quantiles(pos, capacity_mu, capacity_sigma, quantiles=None):
+    """Total risked capacity at the given quantiles from the moment-matched approximation"""
+    quantiles, z = power_dens.quantile_grid(quantiles)
+    shift, mu, sigma = portfolio_moments(pos, capacity_mu, capacity_sigma)
+
+    if mu == -np.inf:
+        eds = np.full(len(quantiles), shift)
+    elif sigma == 0:
+        # no right skew: normal with the exact mean and standard deviation
+        eds = shift + np.exp(mu) * z
+    else:
+        eds = shift + np.exp(mu + sigma * z)
+
+    return np.clip(eds, 0, None)
+
+
+def portfolio_monte_carlo(pos, capacity_mu, capacity_sigma, n_samples: int=10**5, seed: int=0,
+                          chunk_size: int=10**7):
+    """Sample total risked capacity directly, for validating the fast methods
+
+    Args:
+        pos, capacity_mu, capacity_sigma (array): per-prospect inputs
+        n_samples (int): number of portfolio realizations
+        seed (int): random seed
+        chunk_size (int): prospect draws per chunk, bounds memory
+
+    Returns:
+        totals (ndarray): sampled total capacity in MWe
+    """
+    pos, capacity_mu, capacity_sigma = (np.atleast_1d(np.asarray(x, dtype=float))
+                                        for x in (pos, capacity_mu, capacity_sigma))
+    rng = np.random.default_rng(seed)
+    rows = max(chunk_size // len(pos), 1)
+
+    totals = np.empty(n_samples)
+    for start in range(0, n_samples, rows):
+        n = min(rows, n_samples - start)
+        success = rng.random((n, len(pos))) < pos
+        capacity = np.exp(capacity_mu + capacity_sigma * rng.standard_normal((n, len(pos))))
+        totals[start:start + n] = (success * capacity).sum(axis=1)
+
+    return totals
+
+
+def portfolio_cumulative_conf(pos, areaP90, areaP10, pdP90, pdP10, method: str='fft', quantiles=None, **kwargs):
+    """Cumulative confidence curve of total risked capacity over a portfolio
+
+    Args:
+        pos (array): probability of exploration success per prospect, as fractions
+        areaP90, areaP10 (array): pessimistic and optimistic area in sqkm
+        pdP90, pdP10 (array): pessimistic and optimistic power density in MWe/sqkm
+        method (str): 'fft', 'moments' or 'montecarlo'
+        quantiles (array, optional): quantile grid, defaults to power_dens.CONF_GRID
+        **kwargs: passed to portfolio_fft or portfolio_monte_carlo
+
+    Returns:
+        prob_df (pandas Dataframe): cumulative confidence curve in the layout of
+            power_dens.calculate_cumulative_conf
+    """
+    params = portfolio_params(pos, areaP90, areaP10, pdP90, pdP10)
+
+    if method == 'fft':
+        return portfolio_fft(*params, **kwargs).cumulative_conf(quantiles)
+
+    quantiles, _ = power_dens.quantile_grid(quantiles)
+    if method == 'moments':
+        return _conf_frame(quantiles, portfolio_quantiles(*params, quantiles=quantiles))
+    if method == 'montecarlo':
+        return _conf_frame(quantiles, np.quantile(portfolio_monte_carlo(*params, **kwargs), quantiles))
+
+    raise ValueError("method should be 'fft', 'moments' or 'montecarlo'")
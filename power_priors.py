@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+"""Temperature-conditioned power density priors fitted from the database
+
+For prospects without developed analogues, a power density range is read off a prior
+fitted over sliding temperature windows: for every window centre on a fixed temperature
+grid and every system type (plus all systems together), the fields within
++/- WINDOW_HALF_WIDTH degC give a lognormal P90/P10 and the empirical P90/P50/P10.
+
+The fitted table is saved in one compressed .npz file together with the few columns of
+the records it was fitted from. When new field records are appended to the database,
+only the log-sums of the windows they fall in change and only those windows' empirical
+quantiles are recomputed. Lookups round the temperature to the grid and index the
+table, so defaults for thousands of prospects are array reads with no fitting.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+import power_data
+import power_dens
+
+TEMPERATURE = 'Average temperature [degC]'
+POWER_DENSITY = 'Power density [MWe/km2]'
+SYSTEM_TYPE = 'System type'
+
+# Window centres every TEMPERATURE_STEP degC, each covering +/- WINDOW_HALF_WIDTH degC
+TEMPERATURE_GRID = np.arange(50., 375., 5.)
+TEMPERATURE_STEP = 5.
+WINDOW_HALF_WIDTH = 25.
+
+# Group 0 pools all system types
+ALL_SYSTEMS = 'All'
+
+# Windows with fewer fields are left as NaN, and lookups fall back to all systems
+MIN_RECORDS = 3
+
+DEFAULT_PRIORS = power_data.DATA_DIR / 'PowerDensityPriors.npz'
+
+# Empirical P90 (pessimistic) is the 10th percentile of the window's power densities
+P_VALUE_QUANTILES = np.array([0.1, 0.5, 0.9])
+
+
+def _records(database):
+    """Temperature, log power density and system type of the usable database rows"""
+    temperature = database[TEMPERATURE].to_numpy(dtype=float)
+    power_density = database[POWER_DENSITY].to_numpy(dtype=float)
+    system_type = database[SYSTEM_TYPE].astype(object).where(database[SYSTEM_TYPE].notna(), '').to_numpy(dtype=str)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_pd = np.log(power_density)
+    keep = np.isfinite(temperature) & np.isfinite(log_pd)
+
+    return temperature[keep], log_pd[keep], system_type[keep]
+
+
+class PowerDensityPriors(object):
+    """Lookup table of power density priors by temperature and system type
+
+    :param groups: system types of the table rows, ALL_SYSTEMS first
+    :param temperature, log_pd, system_type: records the table was fitted from
+    :param count, sum_log, sum_log_sq: (groups, windows) sufficient statistics of log power density
+    :param empirical: (groups, windows, 3) empirical P90, P50 and P10 power density
+    :param n_source: number of database rows the records were taken from
+    """
+
+    def __init__(self, groups, temperature, log_pd, system_type, count, sum_log, sum_log_sq, empirical,
+                 n_source):
+        self.groups = list(groups)
+        self.group_index = {group: i for i, group in enumerate(self.groups)}
+        self.temperature = temperature
+        self.log_pd = log_pd
+        self.system_type = system_type
+        self.count = count
+        self.sum_log = sum_log
+        self.sum_log_sq = sum_log_sq
+        self.empirical = empirical
+        self.n_source = int(n_source)
+
+    @classmethod
+    def fit(cls, database=None):
+        """Fit the table from a database, defaults to data/PowerDensityDatabase_Expanded.csv"""
+        if database is None:
+            database = power_data.load_database()
+
+        temperature, log_pd, system_type = _records(database)
+        groups = [ALL_SYSTEMS] + sorted(str(s) for s in set(system_type) - {''})
+        shape = (len(groups), len(TEMPERATURE_GRID))
+
+        priors = cls(groups, temperature[:0], log_pd[:0], system_type[:0], np.zeros(shape, dtype=np.int64),
+                     np.zeros(shape), np.zeros(shape), np.full(shape + (3,), np.nan), 0)
+        priors._add(temperature, log_pd, system_type)
+        priors.n_source = len(database)
+
+        return priors
+
+    def _windows(self, temperature):
+        """(records, windows) membership of records in the sliding temperature windows"""
+        return np.abs(temperature[:, None] - TEMPERATURE_GRID[None, :]) <= WINDOW_HALF_WIDTH
+
+    def _group_rows(self, system_type):
+        """(records, groups) membership: every record is in ALL_SYSTEMS and its own type"""
+        rows = np.zeros((len(system_type), len(self.groups)), dtype=bool)
+        rows[:, 0] = True
+        for i, group in enumerate(self.groups[1:], start=1):
+            rows[:, i] = system_type == group
+        return rows
+
+    def _add(self, temperature, log_pd, system_type):
+        """Add records to the sufficient statistics and refresh the windows they touch"""
+        new_groups = sorted(str(s) for s in set(system_type) - set(self.groups) - {''})
+        if new_groups:
+            # no earlier record has a new system type, so its rows start empty
+            self.groups += new_groups
+            self.group_index = {group: i for i, group in enumerate(self.groups)}
+            pad = ((0, len(new_groups)), (0, 0))
+            self.count = np.pad(self.count, pad)
+            self.sum_log = np.pad(self.sum_log, pad)
+            self.sum_log_sq = np.pad(self.sum_log_sq, pad)
+            self.empirical = np.pad(self.empirical, pad + ((0, 0),), constant_values=np.nan)
+
+        self.temperature = np.concatenate([self.temperature, temperature])
+        self.log_pd = np.concatenate([self.log_pd, log_pd])
+        self.system_type = np.concatenate([self.system_type, system_type])
+
+        # (groups, windows) sums as matrix products of the membership masks
+        membership = self._group_rows(system_type).T.astype(float)
+        windows = self._windows(temperature).astype(float)
+        self.count += (membership @ windows).round().astype(np.int64)
+        self.sum_log += membership @ (windows * log_pd[:, None])
+        self.sum_log_sq += membership @ (windows * log_pd[:, None]**2)
+
+        # empirical quantiles are recomputed only where records were added
+        touched = (membership @ windows) > 0
+        all_windows = self._windows(self.temperature)
+        all_groups = self._group_rows(self.system_type)
+        for g, w in zip(*np.nonzero(touched)):
+            values = self.log_pd[all_groups[:, g] & all_windows[:, w]]
+            if len(values) >= MIN_RECORDS:
+                self.empirical[g, w] = np.exp(np.quantile(values, P_VALUE_QUANTILES))
+            else:
+                self.empirical[g, w] = np.nan
+
+    def update(self, database):
+        """Bring the table up to date with a database that has had rows appended
+
+        Only the appended rows are added. If the rows the table was fitted from have
+        changed, the table is refitted from scratch.
+
+        Returns:
+            priors (PowerDensityPriors): self, or a refitted table
+        """
+        if len(database) < self.n_source:
+            return PowerDensityPriors.fit(database)
+
+        temperature, log_pd, system_type = _records(database.iloc[:self.n_source])
+        unchanged = (len(temperature) == len(self.temperature)
+                     and np.array_equal(temperature, self.temperature)
+                     and np.array_equal(log_pd, self.log_pd)
+                     and np.array_equal(system_type, self.system_type))
+        if not unchanged:
+            return PowerDensityPriors.fit(database)
+
+        if len(database) > self.n_source:
+            self._add(*_records(database.iloc[self.n_source:]))
+            self.n_source = len(database)
+
+        return self
+
+    def lognormal(self):
+        """(groups, windows) lognormal P90 and P10 power density, NaN for sparse windows"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mu = self.sum_log / self.count
+            variance = (self.sum_log_sq - self.count * mu**2) / (self.count - 1)
+            sigma = np.sqrt(np.clip(variance, 0, None))
+        sparse = self.count < MIN_RECORDS
+        p90 = np.where(sparse, np.nan, np.exp(mu + sigma * power_dens.P_VALUES_Z[0]))
+        p10 = np.where(sparse, np.nan, np.exp(mu + sigma * power_dens.P_VALUES_Z[2]))
+        return p90, p10
+
+    def _lookup_index(self, temperature, system_type):
+        temperature = np.atleast_1d(np.asarray(temperature, dtype=float))
+        window = np.clip(np.rint((temperature - TEMPERATURE_GRID[0]) / TEMPERATURE_STEP), 0,
+                         len(TEMPERATURE_GRID) - 1).astype(np.intp)
+        if system_type is None:
+            group = np.zeros(len(temperature), dtype=np.intp)
+        else:
+            system_type = np.broadcast_to(np.asarray(system_type, dtype=object), temperature.shape)
+            group = np.array([self.group_index.get(ALL_SYSTEMS if s is None else s, 0) for s in system_type],
+                             dtype=np.intp)
+        return window, group
+
+    def lookup(self, temperature, system_type=None, empirical: bool=False):
+        """Prior power density range for one or many prospects
+
+        Windows of a system type with fewer than MIN_RECORDS fields fall back to all
+        systems at the same temperature, as do unknown system types.
+
+        Args:
+            temperature (float or array): prospect temperature in degC, rounded to the grid
+            system_type (str or array, optional): system type per prospect, None for all
+            empirical (bool): empirical P90/P50/P10 instead of the lognormal P90/P10
+
+        Returns:
+            pdP90, pdP10 (ndarray): lognormal prior in MWe/km2, or with empirical=True
+            pvalues (ndarray): (prospects, 3) empirical P90, P50 and P10 in MWe/km2
+        """
+        window, group = self._lookup_index(temperature, system_type)
+        group = np.where(self.count[group, window] >= MIN_RECORDS, group, 0)
+
+        if empirical:
+            return self.empirical[group, window]
+
+        p90, p10 = self.lognormal()
+        return p90[group, window], p10[group, window]
+
+    def counts(self, temperature, system_type=None):
+        """Number of fields in the window of each prospect, before any fallback"""
+        window, group = self._lookup_index(temperature, system_type)
+        return self.count[group, window]
+
+    def save(self, path=DEFAULT_PRIORS):
+        """Write the table and its records to a compressed .npz file
+
+        The file is written under a unique temporary name and then moved into place, so
+        concurrent writers never see or clobber each other's partial files.
+        """
+        path = Path(path)
+        handle = tempfile.NamedTemporaryFile(dir=path.parent, prefix=path.name + '.', suffix='.tmp', delete=False)
+        partial = Path(handle.name)
+        try:
+            with handle:
+                np.savez_compressed(handle, groups=np.array(self.groups), temperature=self.temperature,
+                                    log_pd=self.log_pd, system_type=self.system_type, count=self.count,
+                                    sum_log=self.sum_log, sum_log_sq=self.sum_log_sq, empirical=self.empirical,
+                                    n_source=self.n_source, grid=TEMPERATURE_GRID, half_width=WINDOW_HALF_WIDTH)
+            partial.replace(path)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+
+    @classmethod
+    def read(cls, path=DEFAULT_PRIORS):
+        """Read a table written by save, None if it was fitted on another temperature grid"""
+        with np.load(path) as table:
+            if not (np.array_equal(table['grid'], TEMPERATURE_GRID) and table['half_width'] == WINDOW_HALF_WIDTH):
+                return None
+            return cls(table['groups'].tolist(), table['temperature'], table['log_pd'], table['system_type'],
+                       table['count'], table['sum_log'], table['sum_log_sq'], table['empirical'],
+                       table['n_source'])
+
+
+def load_priors(path=DEFAULT_PRIORS, database=None):
+    """Read the saved priors, fitting or updating and saving them only when needed
+
+    Args:
+        path (str or Path): .npz file of the table, defaults to data/PowerDensityPriors.npz
+        database (pandas Dataframe, optional): database to fit from, defaults to
+            data/PowerDensityDatabase_Expanded.csv
+
+    Returns:
+        priors (PowerDensityPriors): table up to date with the database; when the table
+            cannot be saved (e.g. a read-only install) it is still returned, and refitted
+            on the next call
+    """
+    if database is None:
+        database = power_data.load_database()
+
+    saved = PowerDensityPriors.read(path) if Path(path).exists() else None
+    if saved is None:
+        priors = PowerDensityPriors.fit(database)
+    else:
+        n_source = saved.n_source
+        priors = saved.update(database)
+        if priors is saved and priors.n_source == n_source:
+            return priors
+
+    try:
+        priors.save(path)
+    except OSError:
+        pass
+
+    return priors
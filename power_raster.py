@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""Capacity over raster grids of per-cell area and P90/P10 power density
+
+Every cell of the grids is one lognormal scenario: its area P90/P10 is the productive
+area the conceptual model assigns to the cell and its power density P90/P10 comes from
+the map. Grids can be NumPy arrays or memory-mapped files (np.load(path, mmap_mode='r')),
+and are processed in square tiles, so only a few tiles are ever in memory. Tiles run on
+a thread pool: the array operations release the GIL, and threads can write straight into
+a shared (memory-mapped) output grid.
+
+Per-cell P-values can be aggregated within zones given as an integer label grid, a
+boolean mask or polygons in map coordinates. Cells are either independent, in which
+case the zone total is matched to a lognormal on its exact mean and variance, or fully
+correlated, in which case the zone quantiles are the sums of the cell quantiles.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import power_dens
+
+TILE_SIZE = 1024
+
+
+def tiles(shape, tile: int=TILE_SIZE):
+    """Row and column slices of the tiles covering a grid of the given shape"""
+    rows, cols = shape
+    for row in range(0, rows, tile):
+        for col in range(0, cols, tile):
+            yield slice(row, min(row + tile, rows)), slice(col, min(col + tile, cols))
+
+
+def _grids(areaP90, areaP10, pdP90, pdP10):
+    """Check that the input grids are 2-D and of one shape, without reading them"""
+    grids = [np.asanyarray(x) for x in (areaP90, areaP10, pdP90, pdP10)]
+    shapes = {x.shape for x in grids if x.ndim}
+    if len(shapes) != 1 or any(x.ndim not in (0, 2) for x in grids):
+        raise ValueError("input grids should be 2-D and of the same shape (scalars are broadcast)")
+    return grids, shapes.pop()
+
+
+def _tile_params(grids, window, correlation):
+    """Capacity mu and sigma of one tile, NaN for cells without valid inputs"""
+    inputs = [np.asarray(x[window] if x.ndim else x, dtype=float) for x in grids]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        capacity_mu, capacity_sigma = power_dens.capacity_params(*inputs, correlation=correlation)
+    return np.broadcast_arrays(capacity_mu, capacity_sigma)
+
+
+def _run(function, windows, n_jobs):
+    if n_jobs == 1:
+        return [function(window) for window in windows]
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(function, windows))
+
+
+def raster_pvalues(areaP90, areaP10, pdP90, pdP10, correlation: float=0., out=None, dtype='float32',
+                   tile: int=TILE_SIZE, n_jobs: int=1):
+    """Per-cell P90, P50 and P10 capacity of gridded inputs
+
+    Args:
+        areaP90, areaP10 (2-D array): pessimistic and optimistic productive area per cell in sqkm
+        pdP90, pdP10 (2-D array): pessimistic and optimistic power density per cell in MWe/sqkm
+        correlation (float): correlation of log area and log power density
+        out (array, optional): (3, rows, cols) output grid, e.g. np.lib.format.open_memmap
+        dtype (str): dtype of the output when out is not given
+        tile (int): tile edge length in cells
+        n_jobs (int): threads processing tiles
+
+    Returns:
+        pvalues (ndarray): (3, rows, cols) P90, P50 and P10 in MW, NaN where the inputs are missing
+    """
+    grids, shape = _grids(areaP90, areaP10, pdP90, pdP10)
+    if out is None:
+        out = np.empty((3,) + shape, dtype=dtype)
+    elif out.shape != (3,) + shape:
+        raise ValueError(f"out should have shape {(3,) + shape}")
+
+    def process(window):
+        capacity_mu, capacity_sigma = _tile_params(grids, window, correlation)
+        for k, z in enumerate(power_dens.P_VALUES_Z):
+            out[(k,) + window] = np.exp(capacity_mu + capacity_sigma * z)
+
+    _run(process, tiles(shape, tile), n_jobs)
+
+    return out
+
+
+def cell_centres(window, transform=None):
+    """Map coordinates of the cell centres of one tile
+
+    Args:
+        window (tuple): row and column slices
+        transform (tuple, optional): (x0, dx, y0, dy) so that cell (row, col) is centred on
+            x0 + (col + 0.5) * dx, y0 + (row + 0.5) * dy. Defaults to cell coordinates.
+
+    Returns:
+        x, y (ndarray): coordinates of the tile's cells
+    """
+    x0, dx, y0, dy = transform if transform is not None else (0., 1., 0., 1.)
+    rows, cols = window
+    x = x0 + (np.arange(cols.start, cols.stop) + 0.5) * dx
+    y = y0 + (np.arange(rows.start, rows.stop) + 0.5) * dy
+    return np.meshgrid(x, y)
+
+
+def points_in_polygon(x, y, polygon):
+    """Even-odd rule test of points against a polygon given as an (N, 2) array of vertices"""
+    polygon = np.asarray(polygon, dtype=float)
+    inside = np.zeros(np.shape(x), dtype=bool)
+
+    # skip the edge loop when the points and the polygon's bounding box do not overlap
+    (xmin, ymin), (xmax, ymax) = polygon.min(axis=0), polygon.max(axis=0)
+    if x.size == 0 or x.max() < xmin or x.min() > xmax or y.max() < ymin or y.min() > ymax:
+        return inside
+
+    x1, y1 = polygon.T
+    x2, y2 = np.roll(polygon, -1, axis=0).T
+    for ax, ay, bx, by in zip(x1, y1, x2, y2):
+        if ay == by:
+            continue
+        crosses = (ay > y) != (by > y)
+        inside ^= crosses & (x < (bx - ax) * (y - ay) / (by - ay) + ax)
+
+    return inside
+
+
+def zonal_capacity(areaP90, areaP10, pdP90, pdP10, zones=None, polygons=None, transform=None,
+                   correlation: float=0., dependence: str='independent', tile: int=TILE_SIZE, n_jobs: int=1):
+    """Total capacity of the cells within zones, masks or polygons
+
+    Args:
+        areaP90, areaP10, pdP90, pdP10 (2-D array): per-cell inputs, see raster_pvalues
+        zones (2-D array, optional): integer zone label per cell (0 for none) or a boolean
+            mask, which is zone 1
+        polygons (dict or list, optional): (N, 2) vertex arrays in map coordinates, by name;
+            used instead of zones and may overlap
+        transform (tuple, optional): (x0, dx, y0, dy) of the grid, see cell_centres
+        correlation (float): correlation of log area and log power density within each cell
+        dependence (str): 'independent' cells, with the zone total matched to a lognormal on
+            its exact mean and variance, or 'comonotonic' (fully correlated) cells, whose
+            quantiles add up
+        tile (int): tile edge length in cells
+        n_jobs (int): threads processing tiles
+
+    Returns:
+        zonal_df (pandas Dataframe): number of cells, mean and P90, P50 and P10 total
+            capacity in MWe by zone
+    """
+    if dependence not in ('independent', 'comonotonic'):
+        raise ValueError("dependence should be 'independent' or 'comonotonic'")
+    grids, shape = _grids(areaP90, areaP10, pdP90, pdP10)
+
+    if polygons is not None:
+        if not isinstance(polygons, dict):
+            polygons = dict(enumerate(polygons, start=1))
+        names = list(polygons)
+        vertices = [np.asarray(polygons[name], dtype=float) for name in names]
+    elif zones is not None:
+        zones = np.asanyarray(zones)
+        if zones.shape != shape:
+            raise ValueError("zones should have the shape of the input grids")
+        if zones.dtype == bool:
+            names = [1]
+        else:
+            names = None
+    else:
+        names = [1]
+
+    def process(window):
+        capacity_mu, capacity_sigma = _tile_params(grids, window, correlation)
+        valid = np.isfinite(capacity_mu) & np.isfinite(capacity_sigma)
+
+        # per-cell moments and quantiles, summed per zone below
+        mean = np.exp(capacity_mu + capacity_sigma**2 / 2)
+        stats = [valid.astype(float), mean, mean**2 * np.expm1(capacity_sigma**2)]
+        stats += [np.exp(capacity_mu + capacity_sigma * z) for z in power_dens.P_VALUES_Z]
+        stats = np.stack([np.where(valid, s, 0.) for s in stats])
+
+        if polygons is not None:
+            x, y = cell_centres(window, transform)
+            return np.stack([stats[:, points_in_polygon(x, y, polygon)].sum(axis=1) for polygon in vertices])
+
+        if zones is None:
+            return stats.reshape(len(stats), -1).sum(axis=1)[None, :]
+        labels = np.asarray(zones[window]).astype(np.int64).ravel()
+        labels = np.where(labels > 0, labels, 0)
+        return np.stack([np.bincount(labels, weights=s.ravel()) for s in stats], axis=1)[1:]
+
+    partials = _run(process, tiles(shape, tile), n_jobs)
+    n_zones = max([len(p) for p in partials] + [len(names) if names is not None else 0])
+    totals = np.zeros((n_zones, 6))
+    for partial in partials:
+        totals[:len(partial)] += partial
+
+    if names is None:
+        # label grids: zones that occur in the grid
+        names = list(np.flatnonzero(totals[:, 0] > 0) + 1)
+        totals = totals[np.array(names, dtype=int) - 1]
+
+    cells, mean, variance = totals[:, 0], totals[:, 1], totals[:, 2]
+    if dependence == 'comonotonic':
+        pvalues = totals[:, 3:]
+    else:
+        # Fenton-Wilkinson: lognormal with the exact mean and variance of the zone total
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sigma = np.sqrt(np.log1p(variance / mean**2))
+            mu = np.log(mean) - sigma**2 / 2
+        pvalues = np.exp(mu[:, None] + sigma[:, None] * power_dens.P_VALUES_Z[None, :])
+
+    zonal_df = pd.DataFrame({'cells': cells.astype(np.int64), 'Mean (MWe)': mean, 'P90 (MWe)': pvalues[:, 0],
+                             'P50 (MWe)': pvalues[:, 1], 'P10 (MWe)': pvalues[:, 2]},
+                            index=pd.Index(names, name='zone'))
+
+    return zonal_df
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""Risk-tree evaluation of the probability of exploration success for many prospects
+
+The chance of success (POS) of a prospect is the product of its risk factors, e.g.
+temperature, permeability and chemistry in the Streamlit app. Some factors are shared by
+all prospects of the same play, such as a regional heat source: if it fails, every
+prospect of the play fails together. This module takes a long factor table with one row
+per prospect and factor, and evaluates prospect POS and joint portfolio chances with
+array reductions over the table. Shared factors are handled by conditioning on each play
+once, so no combination of outcomes is ever enumerated.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import numpy as np
+import pandas as pd
+
+TABLE_COLUMNS = ['prospect', 'factor', 'probability', 'play']
+
+
+def _log(p):
+    with np.errstate(divide='ignore'):
+        return np.log(p)
+
+
+class RiskTree(object):
+    """Chance of success of prospects with independent and play-level shared risk factors
+
+    :param table: DataFrame with one row per prospect and factor and the columns
+        'prospect', 'factor', 'probability' (fraction) and optionally 'play'. Rows with
+        a play name are shared by every prospect of that play and must carry the same
+        probability for all of them; rows without one are independent. A prospect can
+        belong to at most one play.
+    """
+
+    def __init__(self, table):
+        table = pd.DataFrame(table)
+        if 'play' not in table:
+            table = table.assign(play=None)
+        missing = set(TABLE_COLUMNS) - set(table.columns)
+        if missing:
+            raise ValueError(f"factor table is missing columns: {sorted(missing)}")
+
+        probability = table['probability'].to_numpy(dtype=float)
+        if np.any((probability < 0) | (probability > 1)):
+            raise ValueError("factor probabilities should be fractions between 0 and 1")
+
+        prospect_code, self.prospects = pd.factorize(table['prospect'], sort=False)
+        shared = table['play'].notna().to_numpy()
+        play_code, self.plays = pd.factorize(table['play'], sort=False)
+        n_prospects, n_plays = len(self.prospects), len(self.plays)
+
+        # each prospect belongs to at most one play
+        prospect_play = np.full(n_prospects, -1)
+        prospect_play[prospect_code[shared]] = play_code[shared]
+        if np.any(prospect_play[prospect_code[shared]] != play_code[shared]):
+            raise ValueError("a prospect can only share factors with one play")
+        self.prospect_play = prospect_play
+
+        # shared factors are counted once per play, and must agree between prospects
+        shared_rows = table.loc[shared, ['play', 'factor', 'probability']]
+        spread = shared_rows.groupby(['play', 'factor'], sort=False)['probability'].agg(['min', 'max'])
+        if np.any(spread['min'] != spread['max']):
+            raise ValueError("a shared factor must have the same probability for every prospect of its play")
+        unique = shared_rows.drop_duplicates(['play', 'factor'])
+        unique_play = pd.Index(self.plays).get_indexer(unique['play'])
+
+        # sums of log-probabilities instead of products, one bincount per level
+        self.log_play_chance = np.bincount(unique_play, weights=_log(unique['probability'].to_numpy(dtype=float)),
+                                           minlength=n_plays)
+        self.log_conditional_pos = np.bincount(prospect_code[~shared], weights=_log(probability[~shared]),
+                                               minlength=n_prospects)
+
+    @property
+    def play_chance(self):
+        """Chance that all shared factors of each play succeed"""
+        return pd.Series(np.exp(self.log_play_chance), index=self.plays, name='play chance')
+
+    @property
+    def conditional_pos(self):
+        """POS of each prospect given that its play succeeds"""
+        return pd.Series(np.exp(self.log_conditional_pos), index=self.prospects, name='conditional POS')
+
+    @property
+    def pos(self):
+        """Probability of exploration success of each prospect"""
+        log_pos = self.log_conditional_pos + np.where(self.prospect_play >= 0,
+                                                      self.log_play_chance[self.prospect_play], 0.)
+        return pd.Series(np.exp(log_pos), index=self.prospects, name='POS')
+
+    def expected_successes(self):
+        """Expected number of successful prospects"""
+        return float(self.pos.sum())
+
+    def _log_fail_all(self):
+        """Log-probability that every prospect fails, conditioned once per play"""
+        conditional = np.exp(self.log_conditional_pos)
+        in_play = self.prospect_play >= 0
+
+        # log P(every prospect of the play fails | play succeeds)
+        log_fail_given_play = np.bincount(self.prospect_play[in_play], weights=np.log1p(-conditional[in_play]),
+                                          minlength=len(self.plays))
+        play_chance = np.exp(self.log_play_chance)
+        log_fail_play = np.log1p(-play_chance * -np.expm1(log_fail_given_play))
+
+        return log_fail_play.sum() + np.log1p(-conditional[~in_play]).sum()
+
+    def p_any_success(self):
+        """Chance that at least one prospect of the portfolio succeeds"""
+        return float(-np.expm1(self._log_fail_all()))
+
+    def p_all_success(self):
+        """Chance that every prospect of the portfolio succeeds"""
+        return float(np.exp(self.log_play_chance.sum() + self.log_conditional_pos.sum()))
+
+    def success_count_distribution(self):
+        """Probability of exactly 0, 1, ... N successful prospects
+
+        Evaluated from the probability generating function at the N+1 roots of unity:
+        every play contributes (1 - P_play) + P_play * prod_i (1 - c_i + c_i w) and every
+        independent prospect 1 - p_i + p_i w, and an inverse FFT recovers the probabilities.
+
+        Returns:
+            distribution (pandas Series): probability indexed by number of successes
+        """
+        n = len(self.prospects)
+        omega = np.exp(-2j * np.pi * np.arange(n + 1) / (n + 1))
+        conditional = np.exp(self.log_conditional_pos)
+        in_play = self.prospect_play >= 0
+
+        # (prospects, roots) log generating functions, summed per play
+        with np.errstate(divide='ignore'):
+            log_factor = np.log(1 - conditional[:, None] + conditional[:, None] * omega[None, :])
+        log_play = np.zeros((len(self.plays), n + 1), dtype=complex)
+        np.add.at(log_play, self.prospect_play[in_play], log_factor[in_play])
+
+        play_chance = np.exp(self.log_play_chance)[:, None]
+        generating = np.prod(1 - play_chance + play_chance * np.exp(log_play), axis=0) \
+            * np.exp(log_factor[~in_play].sum(axis=0))
+
+        probability = np.fft.ifft(generating).real.clip(0)
+
+        return pd.Series(probability / probability.sum(), index=pd.RangeIndex(n + 1, name='successes'),
+                         name='probability')
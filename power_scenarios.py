@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""Scenario store for comparing many capacity scenarios side by side
+
+Scenarios are keyed by a hash of their inputs, so re-adding the same inputs is a lookup
+and changing any input gives a new key. Curves come from a memoized calculation with
+bounded LRU eviction, shared by every store in the process. The comparison table and
+overlay curves are assembled from the stored curves without any recalculation, and only
+after the store changed; its version number lets callers such as the Streamlit app,
+which reruns from the top on every interaction, rebuild plots only when something did.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import power_dens
+
+INPUT_NAMES = ['areaP90', 'areaP10', 'pdP90', 'pdP10', 'correlation']
+
+# Curves kept by the memoized calculation; the least recently used are evicted first
+CACHE_SIZE = 512
+
+CONFIDENCE = 'Cumulative confidence (%)'
+CAPACITY = 'Expected development size (MWe)'
+
+
+def scenario_key(areaP90, areaP10, pdP90, pdP10, correlation=0.):
+    """Stable hash of the scenario inputs"""
+    values = np.array([areaP90, areaP10, pdP90, pdP10, correlation], dtype=float)
+    return hashlib.sha1(values.tobytes()).hexdigest()[:16]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def cached_curve(areaP90: float, areaP10: float, pdP90: float, pdP10: float, correlation: float=0.):
+    """Memoized power_dens.capacity_curve on the default grid; treat the result as read-only"""
+    return power_dens.capacity_curve(areaP90, areaP10, pdP90, pdP10, correlation=correlation)
+
+
+class ScenarioStore(object):
+    """Named capacity scenarios, recomputed only when their inputs change
+
+    :param maxsize: most scenarios kept; adding more drops the oldest
+    """
+
+    def __init__(self, maxsize: int=200):
+        self.maxsize = maxsize
+        # name -> (key, inputs, curve), in insertion order
+        self.scenarios = OrderedDict()
+        self.version = 0
+        self._table = None
+        self._overlay = None
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    def __contains__(self, name):
+        return name in self.scenarios
+
+    def add(self, name, areaP90, areaP10, pdP90, pdP10, correlation=0.):
+        """Add or replace a scenario
+
+        Returns:
+            changed (bool): False if the scenario already had exactly these inputs
+        """
+        inputs = tuple(float(x) for x in (areaP90, areaP10, pdP90, pdP10, correlation))
+        key = scenario_key(*inputs)
+        if name in self.scenarios and self.scenarios[name][0] == key:
+            return False
+
+        curve = cached_curve(*inputs)
+        self.scenarios[name] = (key, inputs, curve)
+        while len(self.scenarios) > self.maxsize:
+            self.scenarios.popitem(last=False)
+
+        self._changed()
+        return True
+
+    def remove(self, name):
+        if self.scenarios.pop(name, None) is not None:
+            self._changed()
+
+    def clear(self):
+        if self.scenarios:
+            self.scenarios.clear()
+            self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._table = None
+        self._overlay = None
+
+    def curve(self, name):
+        """CapacityCurve of one scenario"""
+        return self.scenarios[name][2]
+
+    def comparison_table(self):
+        """One row per scenario with its inputs and P90, P50, P10 and mean capacity in MWe"""
+        if self._table is None:
+            names = list(self.scenarios)
+            inputs = np.array([self.scenarios[name][1] for name in names]).reshape(-1, len(INPUT_NAMES))
+            curves = [self.scenarios[name][2] for name in names]
+            table = pd.DataFrame(inputs, index=pd.Index(names, name='scenario'), columns=INPUT_NAMES)
+            table['P90 (MWe)'] = [curve.P90 for curve in curves]
+            table['P50 (MWe)'] = [curve.P50 for curve in curves]
+            table['P10 (MWe)'] = [curve.P10 for curve in curves]
+            table['Mean (MWe)'] = [curve.mean for curve in curves]
+            self._table = table
+        return self._table
+
+    def overlay_frame(self):
+        """Long-form curves of all scenarios for an overlay plot, one row per scenario and point"""
+        if self._overlay is None:
+            labels = power_dens.confidence_labels(power_dens.CONF_GRID)
+            names = list(self.scenarios)
+            values = np.array([self.scenarios[name][2].values for name in names]).reshape(len(names), len(labels))
+            self._overlay = pd.DataFrame({'scenario': np.repeat(names, values.shape[1]),
+                                          CONFIDENCE: np.tile(labels, len(names)),
+                                          CAPACITY: values.ravel()})
+        return self._overlay
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""Sensitivity of capacity P-values to the four inputs
+
+Tornado swings, elasticities and one- and two-way sweeps for one or many base
+scenarios. All perturbed scenarios are laid out on extra array axes and evaluated in one
+broadcast of the log-space closed form, ln P = mu + sigma z, and the elasticities
+d ln P / d ln x are taken analytically from the same formula.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import numpy as np
+import pandas as pd
+
+import power_dens
+
+INPUT_NAMES = ['areaP90', 'areaP10', 'pdP90', 'pdP10']
+P_VALUE_NAMES = ['P90', 'P50', 'P10']
+
+
+def _base(areaP90, areaP10, pdP90, pdP10):
+    """(scenarios, 4) matrix of the base inputs"""
+    return np.stack(power_dens._scenario_arrays(areaP90, areaP10, pdP90, pdP10), axis=-1)
+
+
+def _pvalues(inputs, correlation):
+    """P90, P50 and P10 of an input array whose last axis holds the four inputs"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return power_dens.capacity_pvalues(*np.moveaxis(inputs, -1, 0), correlation=correlation)
+
+
+def tornado(areaP90, areaP10, pdP90, pdP10, low: float=0.8, high: float=1.2, correlation=0.):
+    """P-values with each input scaled down and up in turn, the others at their base value
+
+    Args:
+        areaP90, areaP10, pdP90, pdP10 (float or array): base scenario inputs
+        low, high (float): factors applied to one input at a time
+        correlation (float or array): correlation of log area and log power density
+
+    Returns:
+        tornado_df (pandas Dataframe): indexed by scenario and input, with the P-values at
+            the low and high factor and their swing (high - low) in MW. A single scenario
+            is sorted by P10 swing, largest first, as plotted in a tornado chart; P50
+            swings are the same for all four inputs.
+    """
+    base = _base(areaP90, areaP10, pdP90, pdP10)
+    n = len(base)
+    correlation = np.asarray(correlation, dtype=float)
+    if correlation.ndim:
+        correlation = correlation.reshape(-1, 1, 1)
+
+    # (scenarios, perturbed input, low/high, inputs)
+    inputs = np.broadcast_to(base[:, None, None, :], (n, 4, 2, 4)).copy()
+    for k in range(4):
+        inputs[:, k, :, k] *= [low, high]
+    pvalues = _pvalues(inputs, correlation)
+
+    columns = {}
+    for j, name in enumerate(P_VALUE_NAMES):
+        columns[f'{name} low (MWe)'] = pvalues[:, :, 0, j].ravel()
+        columns[f'{name} high (MWe)'] = pvalues[:, :, 1, j].ravel()
+        columns[f'{name} swing (MWe)'] = (pvalues[:, :, 1, j] - pvalues[:, :, 0, j]).ravel()
+    index = pd.MultiIndex.from_product([range(n), INPUT_NAMES], names=['scenario', 'input'])
+    tornado_df = pd.DataFrame(columns, index=index)
+
+    if n == 1:
+        order = tornado_df['P10 swing (MWe)'].abs().sort_values(ascending=False, kind='stable').index
+        tornado_df = tornado_df.loc[order]
+
+    return tornado_df
+
+
+def elasticities(areaP90, areaP10, pdP90, pdP10, correlation=0.):
+    """Analytic elasticities d ln P / d ln x of P90, P50 and P10 to each input
+
+    With ln P = mu + sigma z, mu depends on every log input with weight 1/2 and sigma only
+    on the P90-P10 spread of each input, so the P50 elasticity is 1/2 for all four and
+    the P90/P10 elasticities shift by -/+ z d sigma / d ln x.
+
+    Returns:
+        elasticity (ndarray): (scenarios, 4 inputs, 3 P-values), NaN where sigma is 0
+    """
+    base = _base(areaP90, areaP10, pdP90, pdP10)
+    correlation = np.asarray(correlation, dtype=float)
+
+    _, area_sigma = power_dens.lognormal_params(base[:, 0], base[:, 1])
+    _, powerdens_sigma = power_dens.lognormal_params(base[:, 2], base[:, 3])
+    _, capacity_sigma = power_dens.capacity_params(*base.T, correlation=correlation)
+
+    # d sigma / d ln x for areaP90, areaP10, pdP90, pdP10
+    with np.errstate(invalid='ignore', divide='ignore'):
+        area_term = (area_sigma + correlation * powerdens_sigma) / (capacity_sigma * power_dens.P90_P10_Z_SPAN)
+        powerdens_term = (powerdens_sigma + correlation * area_sigma) / (capacity_sigma * power_dens.P90_P10_Z_SPAN)
+    dsigma = np.stack([-area_term, area_term, -powerdens_term, powerdens_term], axis=-1)
+
+    return 0.5 + dsigma[:, :, None] * power_dens.P_VALUES_Z[None, None, :]
+
+
+def variance_shares(areaP90, areaP10, pdP90, pdP10, correlation=0.):
+    """Share of the variance of log capacity due to area and to power density
+
+    The covariance term of correlated inputs is split equally between the two.
+
+    Returns:
+        shares (ndarray): (scenarios, 2) area and power density shares, summing to 1
+    """
+    base = _base(areaP90, areaP10, pdP90, pdP10)
+    correlation = np.asarray(correlation, dtype=float)
+
+    _, area_sigma = power_dens.lognormal_params(base[:, 0], base[:, 1])
+    _, powerdens_sigma = power_dens.lognormal_params(base[:, 2], base[:, 3])
+    covariance = correlation * area_sigma * powerdens_sigma
+    parts = np.stack([area_sigma**2 + covariance, powerdens_sigma**2 + covariance], axis=-1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return parts / parts.sum(axis=-1, keepdims=True)
+
+
+def sweep(areaP90, areaP10, pdP90, pdP10, factors, correlation=0.):
+    """P-values over a grid of multiplicative factors on one or more inputs
+
+    Args:
+        areaP90, areaP10, pdP90, pdP10 (float or array): base scenario inputs
+        factors (dict): input name -> 1-D array of factors; every input gets its own axis,
+            in the order given
+        correlation (float or array): correlation of log area and log power density
+
+    Returns:
+        pvalues (ndarray): (scenarios, len(factors_1), ..., len(factors_k), 3) P90, P50 and P10
+    """
+    unknown = set(factors) - set(INPUT_NAMES)
+    if unknown:
+        raise ValueError(f"unknown inputs {sorted(unknown)}, expected some of {INPUT_NAMES}")
+
+    base = _base(areaP90, areaP10, pdP90, pdP10)
+    n_axes = len(factors)
+    inputs = base.reshape((len(base),) + (1,) * n_axes + (4,))
+
+    scale = np.ones((1,) + tuple(len(f) for f in factors.values()) + (4,))
+    for axis, (name, values) in enumerate(factors.items(), start=1):
+        shape = [1] * (n_axes + 1)
+        shape[axis] = -1
+        scale[..., INPUT_NAMES.index(name)] *= np.asarray(values, dtype=float).reshape(shape)
+
+    correlation = np.asarray(correlation, dtype=float)
+    if correlation.ndim:
+        correlation = correlation.reshape((-1,) + (1,) * n_axes)
+
+    return _pvalues(inputs * scale, correlation)
+
+
+def one_way(areaP90, areaP10, pdP90, pdP10, name: str, factors, correlation=0.):
+    """Sweep of one input as a DataFrame indexed by scenario and factor, one column per P-value"""
+    factors = np.asarray(factors, dtype=float)
+    pvalues = sweep(areaP90, areaP10, pdP90, pdP10, {name: factors}, correlation)
+
+    index = pd.MultiIndex.from_product([range(len(pvalues)), factors], names=['scenario', f'{name} factor'])
+    return pd.DataFrame(pvalues.reshape(-1, 3), index=index, columns=[f'{p} (MWe)' for p in P_VALUE_NAMES])
+
+
+def two_way(areaP90, areaP10, pdP90, pdP10, x: str, x_factors, y: str, y_factors, pvalue: str='P50',
+            correlation=0.):
+    """Two-way sweep of one P-value, as a DataFrame with rows by scenario and x factor and columns by y factor"""
+    x_factors = np.asarray(x_factors, dtype=float)
+    y_factors = np.asarray(y_factors, dtype=float)
+    if x == y:
+        raise ValueError("a two-way sweep needs two different inputs")
+    pvalues = sweep(areaP90, areaP10, pdP90, pdP10, {x: x_factors, y: y_factors}, correlation)
+
+    values = pvalues[..., P_VALUE_NAMES.index(pvalue)]
+    index = pd.MultiIndex.from_product([range(len(values)), x_factors], names=['scenario', f'{x} factor'])
+    columns = pd.Index(y_factors, name=f'{y} factor')
+    return pd.DataFrame(values.reshape(-1, len(y_factors)), index=index, columns=columns)
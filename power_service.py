@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+"""Local HTTP service for the capacity calculation, using only the standard library and NumPy
+
+Endpoints (JSON in, JSON out):
+
+- POST /capacity with one scenario {"areaP90": 1, "areaP10": 10, "pdP90": 10, "pdP10": 24}
+  (optionally "correlation") or a batch {"scenarios": [...]}. Add "curve": true for the
+  cumulative confidence curve; single scenarios include it unless "curve": false.
+- POST /montecarlo with one scenario plus optional "n_samples" and "seed".
+- GET /health
+
+Requests that arrive within a few milliseconds of each other are coalesced into one
+vectorized power_dens calculation. Results are kept in an LRU cache keyed on the
+normalized inputs, and identical scenarios already in flight share one calculation.
+Monte Carlo runs and large batches go to a process pool so the event loop never blocks.
+
+Example:
+    python power_service.py --port 8050 --jobs 2
+    curl -d '{"areaP90": 1, "areaP10": 10, "pdP90": 10, "pdP10": 24}' localhost:8050/capacity
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+import numpy as np
+
+import power_dens
+
+INPUT_NAMES = ['areaP90', 'areaP10', 'pdP90', 'pdP10', 'correlation']
+
+# Requests arriving within COALESCE_WINDOW seconds are computed together
+COALESCE_WINDOW = 0.002
+MAX_BATCH = 50000
+
+# Coalesced batches larger than this are computed in the worker pool
+OFFLOAD_SIZE = 5000
+
+CACHE_SIZE = 10000
+
+# Largest request body in bytes, larger ones are answered with 413
+MAX_BODY = 64 * 2**20
+
+
+class RequestError(ValueError):
+    """Invalid request, answered with 400 Bad Request"""
+
+
+def normalize(scenario):
+    """Validated input tuple of a scenario; also the cache key
+
+    Inputs are rounded to 12 significant digits, so keys do not depend on how a client
+    formats its numbers.
+    """
+    if not isinstance(scenario, dict):
+        raise RequestError("a scenario should be a JSON object")
+    try:
+        values = [float(scenario[name]) for name in INPUT_NAMES[:4]] + [float(scenario.get('correlation', 0.))]
+    except KeyError as error:
+        raise RequestError(f"missing input {error}")
+    except (TypeError, ValueError):
+        raise RequestError("scenario inputs should be numbers")
+
+    if not all(math.isfinite(x) and x > 0 for x in values[:4]):
+        raise RequestError("areas and power densities should be positive numbers")
+    if not -1 <= values[4] <= 1:
+        raise RequestError("correlation should be between -1 and 1")
+
+    return tuple(float(f'{x:.12g}') for x in values)
+
+
+def compute_batch(inputs):
+    """Capacity curves, P-values and means of many normalized scenarios in one call
+
+    Args:
+        inputs (ndarray): (scenarios, 5) areaP90, areaP10, pdP90, pdP10, correlation
+
+    Returns:
+        values (ndarray): (scenarios, quantiles) expected development size in MW
+        pvalues (ndarray): (scenarios, 3) P90, P50 and P10 in MW
+        mean (ndarray): mean capacity in MW
+    """
+    inputs = np.asarray(inputs, dtype=float)
+    curves = power_dens.capacity_curves(*inputs[:, :4].T, correlation=inputs[:, 4])
+    return curves.values, curves.pvalues(), curves.mean
+
+
+def compute_monte_carlo(key, n_samples, seed):
+    """Monte Carlo curve, P-values and mean of one normalized scenario, run in the worker pool"""
+    import power_montecarlo
+
+    areaP90, areaP10, pdP90, pdP10, correlation = key
+    factors = [power_montecarlo.Lognormal(areaP90, areaP10), power_montecarlo.Lognormal(pdP90, pdP10)]
+    histogram = power_montecarlo.monte_carlo_histogram(factors, n_samples=n_samples, seed=seed,
+                                                       correlation=correlation)
+
+    return (histogram.quantile(power_dens.CONF_GRID), histogram.quantile([0.1, 0.5, 0.9]),
+            float(histogram.mean))
+
+
+class LRUCache(object):
+    """Least recently used mapping with a fixed number of entries"""
+
+    def __init__(self, maxsize: int=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class Coalescer(object):
+    """Collect scenarios from concurrent requests and compute them in one batch
+
+    :param executor: process pool for batches larger than offload_size
+    :param cache: LRUCache the results are stored in
+    """
+
+    def __init__(self, executor, cache, window: float=COALESCE_WINDOW, max_batch: int=MAX_BATCH,
+                 offload_size: int=OFFLOAD_SIZE):
+        self.executor = executor
+        self.cache = cache
+        self.window = window
+        self.max_batch = max_batch
+        self.offload_size = offload_size
+        # key -> future; a scenario requested twice before the flush is computed once
+        self.pending = OrderedDict()
+        self.in_flight = {}
+        self.flush_handle = None
+        self.tasks = set()
+        self.batches = 0
+
+    async def compute(self, keys):
+        """Results for a list of normalized scenarios, from the cache or the next batch"""
+        loop = asyncio.get_running_loop()
+        results = [self.cache.get(key) for key in keys]
+
+        waiting = {}
+        for key, result in zip(keys, results):
+            if result is None and key not in waiting:
+                future = self.in_flight.get(key) or self.pending.get(key)
+                if future is None:
+                    future = self.pending[key] = loop.create_future()
+                waiting[key] = future
+
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self.pending and self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.window, self._flush)
+
+        if waiting:
+            done = dict(zip(waiting, await asyncio.gather(*waiting.values())))
+            results = [done[key] if result is None else result for key, result in zip(keys, results)]
+
+        return results
+
+    def _flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, OrderedDict()
+        if batch:
+            self.in_flight.update(batch)
+            # keep a reference so the task is not garbage collected while it runs
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch):
+        keys = list(batch)
+        self.batches += 1
+        try:
+            if len(keys) > self.offload_size:
+                loop = asyncio.get_running_loop()
+                values, pvalues, mean = await loop.run_in_executor(self.executor, compute_batch, keys)
+            else:
+                values, pvalues, mean = compute_batch(keys)
+        except Exception as error:
+            for key, future in batch.items():
+                self.in_flight.pop(key, None)
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        for i, (key, future) in enumerate(batch.items()):
+            # copies, so a cached row does not keep the whole batch matrix alive
+            result = (values[i].copy(), pvalues[i].copy(), float(mean[i]))
+            self.cache.put(key, result)
+            self.in_flight.pop(key, None)
+            if not future.done():
+                future.set_result(result)
+
+
+CURVE_LABELS = [int(x) for x in power_dens.confidence_labels(power_dens.CONF_GRID)]
+
+
+def _response(result, curve):
+    values, pvalues, mean = result
+    body = {'P90': float(pvalues[0]), 'P50': float(pvalues[1]), 'P10': float(pvalues[2]), 'mean': mean}
+    if curve:
+        body['curve'] = {'confidence': CURVE_LABELS, 'capacity': values.tolist()}
+    return body
+
+
+class CapacityService(object):
+    """Request handling of the HTTP service
+
+    :param n_jobs: worker processes for Monte Carlo runs and large batches
+    """
+
+    def __init__(self, n_jobs: int=1, cache_size: int=CACHE_SIZE, window: float=COALESCE_WINDOW):
+        # forked workers would inherit open client sockets and keep connections from closing
+        self.executor = ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context('spawn'))
+        self.cache = LRUCache(cache_size)
+        self.coalescer = Coalescer(self.executor, self.cache, window=window)
+
+    async def capacity(self, payload):
+        if 'scenarios' in payload:
+            if not isinstance(payload['scenarios'], list):
+                raise RequestError("scenarios should be a list")
+            keys = [normalize(scenario) for scenario in payload['scenarios']]
+            results = await self.coalescer.compute(keys)
+            curve = bool(payload.get('curve', False))
+            return {'results': [_response(result, curve) for result in results]}
+
+        (result,) = await self.coalescer.compute([normalize(payload)])
+        return _response(result, bool(payload.get('curve', True)))
+
+    async def monte_carlo(self, payload):
+        key = normalize(payload)
+        try:
+            n_samples = int(payload.get('n_samples', 10**6))
+            seed = int(payload.get('seed', 0))
+        except (TypeError, ValueError):
+            raise RequestError("n_samples and seed should be integers")
+        if not 0 < n_samples <= 10**9:
+            raise RequestError("n_samples should be between 1 and 1e9")
+
+        cache_key = ('montecarlo', key, n_samples, seed)
+        result = self.cache.get(cache_key)
+        if result is None:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, compute_monte_carlo, key, n_samples, seed)
+            self.cache.put(cache_key, result)
+
+        return _response(result, bool(payload.get('curve', True)))
+
+    def health(self):
+        return {'status': 'ok', 'cache_entries': len(self.cache.entries), 'cache_hits': self.cache.hits,
+                'cache_misses': self.cache.misses, 'batches': self.coalescer.batches}
+
+    async def handle(self, method, path, body):
+        """Dispatch one request; returns (status, JSON-serializable body)"""
+        try:
+            if path == '/health' and method == 'GET':
+                return HTTPStatus.OK, self.health()
+            if path not in ('/capacity', '/montecarlo'):
+                return HTTPStatus.NOT_FOUND, {'error': f"unknown path {path}"}
+            if method != 'POST':
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'error': "use POST"}
+
+            try:
+                payload = json.loads(body or b'{}')
+            except ValueError:
+                raise RequestError("body should be JSON")
+            if not isinstance(payload, dict):
+                raise RequestError("body should be a JSON object")
+
+            if path == '/capacity':
+                return HTTPStatus.OK, await self.capacity(payload)
+            return HTTPStatus.OK, await self.monte_carlo(payload)
+
+        except RequestError as error:
+            return HTTPStatus.BAD_REQUEST, {'error': str(error)}
+        except Exception as error:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(error).__name__}: {error}"}
+
+    async def serve_connection(self, reader, writer):
+        """Read HTTP/1.1 requests from one connection until it closes"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    status = HTTPStatus.BAD_REQUEST
+                    response = {'error': "Content-Length should be a non-negative integer"}
+                    keep_alive = False
+                elif length > MAX_BODY:
+                    status, response = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "body too large"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, response = await self.handle(method.upper(), target.split('?', 1)[0], body)
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+
+                data = json.dumps(response).encode()
+                writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                             f'Content-Type: application/json\r\n'
+                             f'Content-Length: {len(data)}\r\n'
+                             f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+
+async def serve(host: str='127.0.0.1', port: int=8050, n_jobs: int=1, cache_size: int=CACHE_SIZE):
+    """Run the service until cancelled"""
+    service = CapacityService(n_jobs=n_jobs, cache_size=cache_size)
+    server = await asyncio.start_server(service.serve_connection, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the power density capacity calculation over HTTP")
+    parser.add_argument('--host', default='127.0.0.1', help="interface to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8050, help="port (default: 8050)")
+    parser.add_argument('--jobs', type=int, default=1, help="worker processes (default: 1)")
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help=f"cached scenario results (default: {CACHE_SIZE})")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.jobs, args.cache_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""Memory-mapped result store for large scenario sweeps
+
+A sweep is written to a directory of .npy files instead of one wide DataFrame:
+
+- curves.npy: dense (scenarios, quantiles) matrix of expected development size in MW,
+  float32 or float64, written chunk by chunk so memory stays bounded
+- one column file per input (areaP90, areaP10, pdP90, pdP10, correlation), plus the
+  scenario IDs and the log-space capacity mu and sigma, which give P-values directly
+- sweep.json with the quantile grid, dtype and number of scenarios
+
+Reopening a sweep maps the files read-only, so nothing is recomputed or read until it
+is sliced. Scenarios are selected by ID or by parameter ranges; contiguous selections
+return views into the mapped files and other selections read only the rows they need.
+"""
+
+__author__ = "William Cumming, Hannah Wood, Jan Niederau"
+__license__ = "Apache-2.0 License"
+
+# Import libraries
+import json
+from pathlib import Path
+
+import numpy as np
+
+import power_backends
+import power_dens
+
+PARAMETER_NAMES = ['areaP90', 'areaP10', 'pdP90', 'pdP10', 'correlation']
+META_FILE = 'sweep.json'
+
+
+def _contiguous(rows):
+    """Turn sorted row numbers into a slice when they are one contiguous run"""
+    if len(rows) and rows[-1] - rows[0] == len(rows) - 1:
+        return slice(int(rows[0]), int(rows[-1]) + 1)
+    return rows
+
+
+def write_sweep(path, areaP90, areaP10, pdP90, pdP10, correlation=0., ids=None, quantiles=None,
+                dtype='float32', chunk_size: int=100000, backend: str='auto'):
+    """Calculate a scenario sweep and write it to a memory-mapped store
+
+    Args:
+        path (str or Path): directory of the store, created if needed
+        areaP90, areaP10 (array): pessimistic and optimistic area in sqkm
+        pdP90, pdP10 (array): pessimistic and optimistic power density in MWe/sqkm
+        correlation (float or array): correlation of log area and log power density
+        ids (array, optional): integer scenario IDs, defaults to 0 .. N-1
+        quantiles (array, optional): quantile grid, defaults to power_dens.CONF_GRID
+        dtype (str): 'float32' halves the size of the curve matrix, 'float64' keeps full precision
+        chunk_size (int): scenarios calculated and written at once
+        backend (str): compute backend of the curves, see power_backends
+
+    Returns:
+        store (SweepStore): the written sweep, opened read-only
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    inputs = power_dens._scenario_arrays(areaP90, areaP10, pdP90, pdP10)
+    n = len(inputs[0])
+    correlation = np.broadcast_to(np.asarray(correlation, dtype=float), (n,))
+    ids = np.arange(n, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+    if ids.shape != (n,):
+        raise ValueError("ids should have one entry per scenario")
+    if len(np.unique(ids)) != n:
+        raise ValueError("ids should be unique")
+    quantiles, z = power_dens.quantile_grid(quantiles)
+
+    for name, values in zip(PARAMETER_NAMES, [*inputs, correlation]):
+        np.save(path / f'{name}.npy', values)
+    np.save(path / 'id.npy', ids)
+
+    mu = np.lib.format.open_memmap(path / 'mu.npy', mode='w+', dtype=np.float64, shape=(n,))
+    sigma = np.lib.format.open_memmap(path / 'sigma.npy', mode='w+', dtype=np.float64, shape=(n,))
+    curves = np.lib.format.open_memmap(path / 'curves.npy', mode='w+', dtype=dtype, shape=(n, len(quantiles)))
+
+    for start in range(0, n, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            capacity_mu, capacity_sigma = power_dens.capacity_params(*(x[chunk] for x in inputs),
+                                                                     correlation=correlation[chunk])
+            mu[chunk] = capacity_mu
+            sigma[chunk] = capacity_sigma
+            curves[chunk] = power_backends.quantile_matrix(capacity_mu, capacity_sigma, z, backend=backend)
+
+    for array in (mu, sigma, curves):
+        array.flush()
+    del mu, sigma, curves
+
+    meta = {'scenarios': n, 'dtype': np.dtype(dtype).name, 'quantiles': quantiles.tolist()}
+    with open(path / META_FILE, 'w') as handle:
+        json.dump(meta, handle)
+
+    return SweepStore(path)
+
+
+class SweepStore(object):
+    """Read-only view of a sweep written by write_sweep
+
+    :param path: directory of the store
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / META_FILE) as handle:
+            meta = json.load(handle)
+
+        self.quantiles = np.array(meta['quantiles'])
+        self.curves = np.load(self.path / 'curves.npy', mmap_mode='r')
+        self.mu = np.load(self.path / 'mu.npy', mmap_mode='r')
+        self.sigma = np.load(self.path / 'sigma.npy', mmap_mode='r')
+        self.ids = np.load(self.path / 'id.npy', mmap_mode='r')
+        self.parameters = {name: np.load(self.path / f'{name}.npy', mmap_mode='r') for name in PARAMETER_NAMES}
+        self._id_order = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return f'SweepStore({len(self)} scenarios x {len(self.quantiles)} quantiles, {self.curves.dtype})'
+
+    def rows(self, ids):
+        """Row numbers of the given scenario IDs; KeyError if any is missing"""
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind='stable')
+        position = np.searchsorted(self.ids, ids, sorter=self._id_order)
+        rows = self._id_order[np.minimum(position, len(self) - 1)]
+        if len(self) == 0 or np.any(self.ids[rows] != ids):
+            raise KeyError("scenario ids not in the store")
+        return rows
+
+    def select(self, ids=None, **ranges):
+        """Rows of the scenarios matching all criteria, as a slice when they are contiguous
+
+        Args:
+            ids (array, optional): scenario IDs
+            **ranges: (low, high) inclusive bounds on any input, e.g. areaP10=(5, 20),
+                or on 'id'
+
+        Returns:
+            rows (slice or ndarray): sorted row numbers for curves_for(), pvalues() and frame()
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if ids is not None:
+            mask[:] = False
+            mask[self.rows(ids)] = True
+        for name, (low, high) in ranges.items():
+            if name == 'id':
+                column = self.ids
+            elif name in self.parameters:
+                column = self.parameters[name]
+            else:
+                raise KeyError(f"unknown parameter {name}, expected one of {['id'] + PARAMETER_NAMES}")
+            mask &= (column >= low) & (column <= high)
+
+        return _contiguous(np.flatnonzero(mask))
+
+    def curves_for(self, rows=slice(None)):
+        """Curve matrix of the selected rows; a view into the mapped file for slices"""
+        return self.curves[rows]
+
+    def pvalues(self, rows=slice(None)):
+        """P90, P50 and P10 capacity in MW of the selected rows, shape (scenarios, 3)"""
+        mu = np.asarray(self.mu[rows])
+        sigma = np.asarray(self.sigma[rows])
+        return np.exp(mu[:, None] + sigma[:, None] * power_dens.P_VALUES_Z[None, :])
+
+    def capacity_curves(self, rows=slice(None)):
+        """Selected rows as a power_dens.CapacityCurves"""
+        return power_dens.CapacityCurves(self.quantiles, self.curves[rows], np.asarray(self.mu[rows]),
+                                         np.asarray(self.sigma[rows]))
+
+    def frame(self, rows=slice(None)):
+        """Parameter table of the selected rows with their P90, P50 and P10 in MWe"""
+        import pandas as pd
+
+        table = pd.DataFrame({name: np.asarray(column[rows]) for name, column in self.parameters.items()},
+                             index=pd.Index(np.asarray(self.ids[rows]), name='id'))
+        pvalues = self.pvalues(rows)
+        table['P90 (MWe)'] = pvalues[:, 0]
+        table['P50 (MWe)'] = pvalues[:, 1]
+        table['P10 (MWe)'] = pvalues[:, 2]
+        return table
@@ -1,36 +1,56 @@
+import sys
+from pathlib import Path
+
 import numpy as np
-from scipy.stats import norm, lognorm
 import pandas as pd
 
+# power_dens.py lives in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import power_backends
+import power_dens
+import power_store
+from power_metrics import Instrumentation
+
 class prospect_confidence(object):
     """
     :param verbose: If “verbose” is True, prints information for debugging.
         If verbose = False your code does not generate ANY output.
+    :param sink: optional instrumentation sink from power_metrics (LoggingSink,
+        CallbackSink, CollectorSink or any object with an emit(event) method) that
+        receives per-stage timings, scenario counts and failure reasons.
     """
     # constructor
-    def __init__(self, verbose = False):
+    def __init__(self, verbose = False, sink = None):
         """  		  	   		     		  		  		    	 		 		   		 		  
         Constructor method
         """
         self.verbose = verbose
+        self.instrument = Instrumentation(sink)
 
 
     def calculate_cumulative_conf(self,
                                   areaP90: float=1.,
                                   areaP10: float=10.,
                                   pdP90: float=10.,
-                                  pdP10: float=24):
+                                  pdP10: float=24.,
+                                  quantiles=None,
+                                  correlation: float=0.):
         """Calculate cumulative confidence level for expected development size in MW
         Args:
             areaP90 (float): pessimistic area in sqkm
             areaP10 (float): optimistic area in sqkm
             pdP90 (float): pessimistic power density in MWe/sqkm
             pdP10 (float): optimistic power density in MWe/sqkm
+            quantiles (array, optional): quantile grid as fractions in [0, 1). Defaults to
+                the 100-point grid. Rows are indexed by the confidence (%) of at least that
+                size, 100 * (1 - quantile), i.e. 100..1 on the default grid as in power_dens
+            correlation (float): correlation of log area and log power density, -1 to 1
 
         Returns:
             prob_df (pandas Dataframe): cumulative confidence curve in Reservoir Size
         """
 
+        assert -1 <= correlation <= 1, "correlation expected to be between -1 and 1"
         assert isinstance(areaP90, float), "areaP90 variable data type expected to be float"
         assert isinstance(areaP10, float), "areaP10 variable data type expected to be float"
         assert isinstance(pdP90, float), "pdP90 variable data type expected to be float"
@@ -42,30 +62,55 @@ class prospect_confidence(object):
             print("pdP90: " , pdP90 )
             print("pdP10: " , pdP10 )
 
-        # calculate area > 250 °C
-        area_mu = ((np.log(areaP90)+np.log(areaP10))/2)
-        area_sigma = (np.log(areaP10)-np.log(areaP90))/((norm.ppf(0.9)-(norm.ppf(0.1))))
+        with self.instrument.stage('fit', method='calculate_cumulative_conf', scenarios=1):
+            # capacity mean and standard dev in log space from the shared core
+            capacity_mu, capacity_sigma = power_dens.capacity_params(areaP90, areaP10, pdP90, pdP10, correlation)
 
-        # calculate powerdensity mean and standard dev
-        powerdens_mu = ((np.log(pdP90)+np.log(pdP10))/2)
-        powerdens_sigma = (np.log(pdP10)-np.log(pdP90))/((norm.ppf(0.9)-(norm.ppf(0.1))))
+        with self.instrument.stage('quantiles', method='calculate_cumulative_conf', scenarios=1):
+            # lognormal quantiles from the precomputed standard normal z-values of the grid
+            grid, z = power_dens.quantile_grid(quantiles)
+            eds = power_backends.quantile_matrix([capacity_mu], [capacity_sigma], z, backend='numpy')[0]
 
-        capacity_mu = area_mu + powerdens_mu
-        capacity_sigma = ((area_sigma**2)+(powerdens_sigma**2))**0.5
-        eds = [lognorm.ppf(x/100, capacity_sigma, loc=0, scale=np.exp(capacity_mu)) for x in range(0,100)]
-        indx = list(np.arange(0,100)[::-1])
-        edsepc_tups = list(zip(indx,eds))
-        prob_df = pd.DataFrame(edsepc_tups, columns = ['Cumulative confidence (%)', 'expected development size (MW)'])
-        prob_df.set_index('Cumulative confidence (%)', inplace = True)
+        with self.instrument.stage('frame', method='calculate_cumulative_conf', scenarios=1):
+            indx = list(power_dens.confidence_labels(grid))
+            edsepc_tups = list(zip(indx,eds))
+            prob_df = pd.DataFrame(edsepc_tups, columns = ['Cumulative confidence (%)', 'expected development size (MW)'])
+            prob_df.set_index('Cumulative confidence (%)', inplace = True)
+
+        self.instrument.count(1, method='calculate_cumulative_conf')
 
         return prob_df
 
 
+    def capacity_confidence(self,
+                            capacity,
+                            areaP90: float=1.,
+                            areaP10: float=10.,
+                            pdP90: float=10.,
+                            pdP10: float=24,
+                            correlation: float=0.):
+        """Calculate the cumulative confidence (%) of at least the given development size(s)
+        Args:
+            capacity (float or array): development size(s) in MW to query
+            areaP90 (float): pessimistic area in sqkm
+            areaP10 (float): optimistic area in sqkm
+            pdP90 (float): pessimistic power density in MWe/sqkm
+            pdP10 (float): optimistic power density in MWe/sqkm
+            correlation (float): correlation of log area and log power density, -1 to 1
+
+        Returns:
+            confidence (ndarray): cumulative confidence (%) for each capacity
+        """
+
+        return power_dens.capacity_confidence(capacity, areaP90, areaP10, pdP90, pdP10, correlation)
+
+
     def add_scenarios(self,
                    areaP90,
                    areaP10,
                    pdP90,
                    pdP10,
+                   correlation=0.,
                    ):
         """ Iterate over scenarios and calculate cumulative confidence for each
         Args:
@@ -73,36 +118,99 @@ class prospect_confidence(object):
             areaP10 (array or list): optimistic area in sqkm
             pdP90 (array or list): pessimistic power density in MWe/sqkm
             pdP10 (array or list): optimistic power density in MWe/sqkm
+            correlation (float, array or list): correlation of log area and log power density,
+                -1 to 1, for all scenarios or per scenario
 
         Returns:
             prob_df (pandas Dataframe): cumulative confidence curve in Reservoir Size by different scenarios
         """
 
+        instrument = self.instrument
+        stage = dict(method='add_scenarios')
+
         try:
-            assert (len(areaP90) == len(areaP10)) & \
-                   (len(areaP90) == len(pdP90)) & \
-                   (len(areaP90) == len(pdP10)), "length of scenario iterables should be the same"
+            with instrument.stage('validation', **stage):
+                assert (len(areaP90) == len(areaP10)) & \
+                       (len(areaP90) == len(pdP90)) & \
+                       (len(areaP90) == len(pdP10)), "length of scenario iterables should be the same"
+                inputs = power_dens._scenario_arrays(areaP90, areaP10, pdP90, pdP10)
+                correlation = np.broadcast_to(np.asarray(correlation, dtype=float), inputs[0].shape)
+                assert np.all(np.abs(correlation) <= 1), "correlation should be between -1 and 1"
+
+        except (AssertionError, TypeError, ValueError) as error:
+            instrument.failure(None, f"{type(error).__name__}: {error}", **stage)
+            instrument.count(0, failed=len(areaP90) if hasattr(areaP90, '__len__') else 0, **stage)
+            print("Type or AttributeError: list or array of floats expected, all of equal length")
+            return None
 
-            #list of dfs to concat
-            list_scenario_df = []
+        n = len(inputs[0])
+        stage['scenarios'] = n
 
-            # iterating over scenarios
-            for a90, a10, p90, p10 in zip(areaP90,areaP10,pdP90,pdP10):
+        if self.verbose:
+            print("scenarios: ", n)
+
+        with instrument.stage('fit', **stage):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                capacity_mu, capacity_sigma = power_dens.capacity_params(*inputs, correlation=correlation)
+
+        with instrument.stage('quantiles', **stage):
+            #calculate cumulative confidences of all scenarios at once
+            eds = power_backends.quantile_matrix(capacity_mu, capacity_sigma, power_dens.CONF_GRID_Z)
+
+        with instrument.stage('frame', **stage):
+            #creating a key for df multi index by unique scenario
+            keys = [str(a90) + "_" + str(a10) + "_"+ str(p90) + "_" + str(p10)
+                    for a90, a10, p90, p10 in zip(areaP90,areaP10,pdP90,pdP10)]
+
+            #multi-index by scenario, one column per scenario
+            columns = pd.MultiIndex.from_product([keys, ['expected development size (MW)']])
+            index = pd.Index(power_dens.confidence_labels(power_dens.CONF_GRID), name='Cumulative confidence (%)')
+            prob_df = pd.DataFrame(eds.T, index=index, columns=columns)
+
+        # scenarios whose curve could not be calculated are kept as NaN columns
+        failed = ~(np.isfinite(capacity_mu) & np.isfinite(capacity_sigma))
+        if instrument and failed.any():
+            positive = np.all([x > 0 for x in inputs], axis=0)
+            for i in np.flatnonzero(failed):
+                reason = "non-positive input" if not positive[i] else "non-finite input"
+                instrument.failure(keys[i], reason, **stage)
+        instrument.count(n - failed.sum(), failed=failed.sum(), **stage)
 
-                #creating a key for df multi index by unique scenario
-                key = [str(a90) + "_" + str(a10) + "_"+ str(p90) + "_" + str(p10)]
-                #calculate cumulative confidences
-                scenario_temp = self.calculate_cumulative_conf(float(a90), float(a10), float(p90), float(p10))
-                #multi-index by scenario
-                scenario_temp.columns = pd.MultiIndex.from_product([key, scenario_temp.columns])
-                #append framse to list
-                list_scenario_df.append(scenario_temp)
+        return prob_df
 
-            #concat and return scenarios as a df
-            return(pd.concat(list_scenario_df, axis = 1))
 
-        except:
-            print("Type or AttributeError: list or array of floats expected, all of equal length")
+    def store_scenarios(self,
+                        path,
+                        areaP90,
+                        areaP10,
+                        pdP90,
+                        pdP10,
+                        correlation=0.,
+                        **kwargs):
+        """ Calculate a large sweep of scenarios into a memory-mapped store instead of a DataFrame
+        Args:
+            path (str or Path): directory of the store
+            areaP90 (array or list): pessimistic area in sqkm
+            areaP10 (array or list): optimistic area in sqkm
+            pdP90 (array or list): pessimistic power density in MWe/sqkm
+            pdP10 (array or list): optimistic power density in MWe/sqkm
+            correlation (float, array or list): correlation of log area and log power density
+            **kwargs: ids, quantiles, dtype and chunk_size, see power_store.write_sweep
+
+        Returns:
+            store (power_store.SweepStore): the sweep, to be sliced by ID or parameter range
+        """
+
+        with self.instrument.stage('store', method='store_scenarios'):
+            store = power_store.write_sweep(path, areaP90, areaP10, pdP90, pdP10, correlation=correlation, **kwargs)
+
+        if self.verbose:
+            print("scenarios: ", len(store))
+
+        failed = int((~np.isfinite(store.mu) | ~np.isfinite(store.sigma)).sum())
+        self.instrument.count(len(store) - failed, failed=failed, method='store_scenarios')
+
+        return store
 
 # if __name__ == "__main__":
 
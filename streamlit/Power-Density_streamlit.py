@@ -14,9 +14,6 @@ Key changes needed include:
 
 -   Remake the power density plot into something that better reflects the underlying data.
 
--   Set up to call the calculate_cumulative_conf from a helper function file 
-    rather than repeat here and elsewhere in the repo. 
-
 There are a number of working refinements and thoughts throughout this file tagged with "NOTE"
 
 """
@@ -26,20 +23,24 @@ import streamlit as st
 import plotly.express as px
 import pandas as pd
 import base64
+import sys
 from pathlib import Path
 
 # Import libraries for computation
 import numpy as np
-import scipy
-from scipy.stats import norm, lognorm
-import matplotlib.pyplot as plt
+
+# Import the shared modules from the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import power_data
+import power_dens
+import power_fanchart
+import power_priors
+import power_scenarios
 
 # ================
 # Helper functions
 # ================
 
-# NOTE We should look at calling the calculate_cumulative_conf function from a centralized function file
-
 def download_link(object_to_download, download_filename, download_link_text):
     """Generates a link from which the user can download object_to_download 
     
@@ -60,7 +61,7 @@ def download_link(object_to_download, download_filename, download_link_text):
     return f'<a href="data:file/txt;base64,{b64}" download="{download_filename}">{download_link_text}</a>'
 
 
-def calculate_cumulative_conf(areaP90: float=1., areaP10: float=10., pdP90: float=10., pdP10: float=24):
+def calculate_cumulative_conf(areaP90: float=1., areaP10: float=10., pdP90: float=10., pdP10: float=24, quantiles=None):
     """Calculate cumulative confidence level for expected development size in MW
 
     Args:
@@ -68,23 +69,16 @@ def calculate_cumulative_conf(areaP90: float=1., areaP10: float=10., pdP90: floa
         areaP10 (float): optimistic area in sqkm
         pdP90 (float): pessimistic power density in MWe/sqkm
         pdP10 (float): optimistic power density in MWe/sqkm
+        quantiles (array, optional): quantile grid as fractions in [0, 1), defaults to 0.00 .. 0.99
 
     Returns:
-        prob_df (pandas Dataframe): cumulative confidence curve in Reservoir Size
+        prob_df (pandas Dataframe): cumulative confidence curve in Reservoir Size, labelled
+            100 .. 1 (%) on the default grid as in power_dens.confidence_labels
     """
-    # calculate area > 250 °C
-    area_mu = ((np.log(areaP90)+np.log(areaP10))/2)
-    area_sigma = (np.log(areaP10)-np.log(areaP90))/((norm.ppf(0.9)-(norm.ppf(0.1))))
-
-    # calculate powerdensity mean and standard dev
-    powerdens_mu = ((np.log(pdP90)+np.log(pdP10))/2)
-    powerdens_sigma = (np.log(pdP10)-np.log(pdP90))/((norm.ppf(0.9)-(norm.ppf(0.1))))
-
-
-    capacity_mu = area_mu + powerdens_mu
-    capacity_sigma = ((area_sigma**2)+(powerdens_sigma**2))**0.5
-    eds = [lognorm.ppf(x/100, capacity_sigma, loc=0, scale=np.exp(capacity_mu)) for x in range(0,100)]
-    indx = list(np.arange(0,100)[::-1])
+    # lognormal quantiles from the shared capacity core in power_dens
+    curve = power_dens.capacity_curve(areaP90, areaP10, pdP90, pdP10, quantiles=quantiles)
+    indx = list(power_dens.confidence_labels(curve.quantiles))
+    eds = curve.values
     edsepc_tups = list(zip(indx,eds))
     prob_df = pd.DataFrame(edsepc_tups, columns = ['Cumulative confidence (%)', 'Expected development size (MWe)'])
 
@@ -240,7 +234,8 @@ st.write('If no analogues can be identified, then take the minimum temperature o
     'For example, a minimum P10 temperature of 250degC would yeld a range as wide as 2 - 23 MW/km2. ' +
     'This wide range is appropriate and reflects the large uncertainty present in the power density estimate when there are no developed analogues.')
 
-pd_database = pd.read_csv(r'https://raw.githubusercontent.com/Geothermal-Resource-Capacity/Power-Density/main/data/PowerDensityDatabase_Expanded.csv')
+# Bundled copy of the database, parsed once per process and shared by all sessions
+pd_database = power_data.load_database('PowerDensityDatabase_Expanded.csv')
 fig = px.scatter(
     pd_database, 
     x='Average temperature [degC]', 
@@ -251,6 +246,18 @@ fig = px.scatter(
 
 st.plotly_chart(fig)
 
+# Prior fitted over all fields within a sliding temperature window, read from a saved table
+priors = power_priors.load_priors(database=pd_database)
+prior_P90, prior_P10 = (float(x[0]) for x in priors.lookup(Tmin))
+prior_fields = int(priors.counts(Tmin)[0])
+if prior_fields < power_priors.MIN_RECORDS or not np.isfinite(prior_P90 + prior_P10):
+    st.write(f'Only {prior_fields} fields lie within {power_priors.WINDOW_HALF_WIDTH:.0f} degC of {Tmin:.0f} degC, ' +
+        'too few to fit a power density prior.')
+else:
+    st.write(f'Fields within {power_priors.WINDOW_HALF_WIDTH:.0f} degC of {Tmin:.0f} degC ' +
+        f'({prior_fields} fields) give a lognormal power density prior of ' +
+        f'{prior_P90:.1f} (P90) to {prior_P10:.1f} (P10) MW/km2.')
+
 st.write('The plotted power density and average temperature are from Wilmarth et al. (2019), which expands on earlier work published ' + 
     '[here](https://www.geothermal-energy.org/pdf/IGAstandard/WGC/2015/16020.pdf). ' +
     'The power density was calculated by dividing the sustained production in MWe by the area within a merged 500 m buffer ' + 
@@ -285,24 +292,20 @@ PowerDens_P10 = float(colB.text_input("P10 (optimistic) power density (MWe/km2)"
 
 # Calculate nu and sigma for resource area 
 # (the mean and variance in log units required for specifying lognormal distributions)
-area_nu = ((np.log(Area_P90)+np.log(Area_P10))/2)
-area_sigma = (np.log(Area_P10)-np.log(Area_P90))/((norm.ppf(1-0.1)-(norm.ppf(0.1))))
+area_nu, area_sigma = power_dens.lognormal_params(Area_P90, Area_P10)
 
 # Calculate nu and sigma for the power density
-powerdens_nu = ((np.log(PowerDens_P90)+np.log(PowerDens_P10))/2)
-powerdens_sigma = (np.log(PowerDens_P10)-np.log(PowerDens_P90))/((norm.ppf(1-0.1)-(norm.ppf(0.1))))
+powerdens_nu, powerdens_sigma = power_dens.lognormal_params(PowerDens_P90, PowerDens_P10)
 
 # Calculate nu and sigma for MWe Capacity
-capacity_nu = area_nu + powerdens_nu
-capacity_sigma = ((area_sigma**2)+(powerdens_sigma**2))**0.5
+capacity_nu, capacity_sigma = power_dens.capacity_params(Area_P90, Area_P10, PowerDens_P90, PowerDens_P10)
 
 indices = ['area [sqkm]', 'power_density [MWe/sqkm]', 'capacity [MWe]']
 p_values = {'P90': [Area_P90, PowerDens_P90, 'P90_capacity'],
             'P50': [round(np.exp(area_nu)), round(np.exp(powerdens_nu)), round(np.exp(capacity_nu))],
             'P10': [Area_P10, PowerDens_P10, 'P10_capacity']}
 
-# NOTE double check these outputs against the cumulative confidence curve
-# Why does np.exp(capacity_nu) = 49% in the cumulative confidence curve data rather than 50%?
+# NOTE the P-values below come from the closed-form quantiles, so np.exp(capacity_nu) is exactly the P50.
 # Would be good also to include the P90 and P10 capacity into the output table
 
 param_df = pd.DataFrame.from_dict(p_values, orient='index', columns=indices)
@@ -342,15 +345,17 @@ col4.write(PowerDens_P10)
 # Row 3 - Range of power capacity
 col1.write('Power Capacity (MWe)')
 
-P90_MWe = prob_df.iloc[9,1]
-col2.write(round(P90_MWe,1))
+# P-values straight from the lognormal quantile function rather than from rows of prob_df
+P90_MWe, P50_MWe, P10_MWe = power_dens.capacity_pvalues(Area_P90, Area_P10, PowerDens_P90, PowerDens_P10)
 
-P50_MWe = prob_df.iloc[49,1]
+col2.write(round(P90_MWe,1))
 col3.write(round(P50_MWe,1))
-
-P10_MWe = prob_df.iloc[89,1]
 col4.write(round(P10_MWe,1))
 
+# Reverse lookup: confidence of at least a given development size
+MWe_query = float(col1.text_input("Confidence of at least this capacity (MWe)", 30))
+col2.write(f'{round(float(power_dens.capacity_confidence(MWe_query, Area_P90, Area_P10, PowerDens_P90, PowerDens_P10)))}%')
+
 #
 # Plot cumulative confidence curve
 #
@@ -370,6 +375,49 @@ fig = px.bar(
 
 st.plotly_chart(fig)
 
+# ---------------------------------------------
+# Power capacity - compare scenarios side by side
+# ---------------------------------------------
+
+# The store lives in the session, so reruns only recompute scenarios whose inputs changed
+if 'scenarios' not in st.session_state:
+    st.session_state['scenarios'] = power_scenarios.ScenarioStore()
+scenarios = st.session_state['scenarios']
+
+st.write('### Compare scenarios')
+cola, colb = st.columns(2)
+scenario_name = cola.text_input("Scenario name", f'Scenario {len(scenarios) + 1}')
+if colb.button('Add current inputs to the comparison'):
+    scenarios.add(scenario_name, Area_P90, Area_P10, PowerDens_P90, PowerDens_P10)
+
+if len(scenarios):
+    cola, colb = st.columns(2)
+    dropped = cola.selectbox("Scenario to remove", list(scenarios.scenarios))
+    if colb.button('Remove scenario'):
+        scenarios.remove(dropped)
+
+if len(scenarios):
+    st.dataframe(scenarios.comparison_table().round(1))
+
+    # the overlay figure is rebuilt only when the store changed; its confidence labels come
+    # from power_dens.confidence_labels like those of prob_df, so it lines up with the bar chart
+    if st.session_state.get('overlay_version') != (scenarios.version, x_max):
+        if len(scenarios) <= power_fanchart.MAX_CURVES:
+            overlay_df, color = scenarios.overlay_frame(), 'scenario'
+        else:
+            # many scenarios: percentile bands and a few representative curves keep the figure small
+            names = list(scenarios.scenarios)
+            curves = np.array([scenarios.curve(name).values for name in names])
+            overlay_df, color = power_fanchart.fan_chart(curves, names=names), 'line'
+        st.session_state['overlay_fig'] = px.line(
+            overlay_df,
+            x='Expected development size (MWe)',
+            y='Cumulative confidence (%)',
+            color=color,
+            range_x=[0,x_max])
+        st.session_state['overlay_version'] = (scenarios.version, x_max)
+    st.plotly_chart(st.session_state['overlay_fig'])
+
 # -------------------------------------------------------------------------
 # Power capacity - Show/hide full results summary and downloadable results 
 # -------------------------------------------------------------------------
@@ -380,8 +428,8 @@ with st_ex_AdvancedOutput:   # Make these results hidden until expanded
     ### Text output ###
     st.markdown("___")
     #st.write("## Computation outputs ")
-    # Display the table, only every 10th row, and hide the index column to make it pretty
-    st.table(prob_df[prob_df.index%10==9].assign(hideIndex='').set_index('hideIndex'))
+    # Display the table, only every 10th confidence level, and hide the index column to make it pretty
+    st.table(prob_df[prob_df['Cumulative confidence (%)']%10==0].assign(hideIndex='').set_index('hideIndex'))
 
     st.write("Calculate nu and sigma for area > 250 degC (the mean and variance in log units required for specifying lognormal distributions)", area_nu)
     st.write("Area sigma", area_sigma)
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# the modules live in the repository root and the class in power_user_class
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'power_user_class'))
@@ -0,0 +1,24 @@
+import warnings
+
+import numpy as np
+
+import power_backends
+import power_dens
+
+
+def test_degenerate_capacity_is_a_constant_curve():
+    # equal spreads of area and power density with a correlation of -1 cancel out
+    capacity_mu, capacity_sigma = power_dens.capacity_params(1., 10., 1., 10., correlation=-1.)
+    assert capacity_sigma == 0
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        curve = power_dens.capacity_curve(1., 10., 1., 10., correlation=-1.)
+        for name in power_backends.available_backends():
+            values = power_backends.quantile_matrix([capacity_mu, 0.], [capacity_sigma, 1.], power_dens.CONF_GRID_Z,
+                                                    backend=name)
+            np.testing.assert_array_equal(values[0], np.exp(capacity_mu))
+            np.testing.assert_array_equal(values[1], np.exp(power_dens.CONF_GRID_Z))
+    power_backends.BACKENDS['process'].close()
+
+    np.testing.assert_array_equal(curve.values, np.exp(capacity_mu))
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+import power_dens
+from confidence_Class import prospect_confidence
+
+
+def test_default_and_explicit_grid_give_identical_frames():
+    user = prospect_confidence()
+    default = user.calculate_cumulative_conf(1., 10., 10., 24.)
+    explicit = user.calculate_cumulative_conf(1., 10., 10., 24., quantiles=np.arange(100) / 100)
+
+    pd.testing.assert_frame_equal(default, explicit)
+    assert list(default.index) == list(range(100, 0, -1))
+
+
+def test_labels_match_power_dens():
+    user = prospect_confidence()
+    single = user.calculate_cumulative_conf(1., 10., 10., 24.)
+    scenarios = user.add_scenarios([1., 2.], [10., 9.], [10., 8.], [24., 20.])
+    reference = power_dens.calculate_cumulative_conf(1., 10., 10., 24.)
+
+    np.testing.assert_array_equal(single.index, reference['Cumulative confidence (%)'])
+    np.testing.assert_array_equal(scenarios.index, single.index)
+    np.testing.assert_array_equal(single.iloc[:, 0], reference.iloc[:, 1])
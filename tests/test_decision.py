@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import integrate
+from scipy.stats import norm
+
+import power_decision
+import power_dens
+
+
+@pytest.mark.parametrize('margin, development_cost', [(2., 50.), (2., 0.), (2., -10.), (-1., -40.), (-1., 10.), (0., -5.)])
+def test_success_value_matches_numerical_integration(margin, development_cost):
+    mu, sigma = power_dens.capacity_params(1., 10., 10., 24.)
+    # integrate over the standard normal z of log capacity, split at the threshold
+    threshold = (np.log(development_cost / margin) - mu) / sigma if development_cost * margin > 0 else 0.
+    payoff = lambda z: max(margin * np.exp(mu + sigma * z) - development_cost, 0) * norm.pdf(z)
+    reference = integrate.quad(payoff, -15, 15, points=[np.clip(threshold, -15, 15)], limit=200, epsabs=1e-12)[0]
+
+    value = power_decision.success_value(np.array([mu]), np.array([sigma]), margin, development_cost)
+    np.testing.assert_allclose(value, reference, rtol=1e-7, atol=1e-9)
+
+
+def test_success_value_without_spread_and_unrevealed_capacity():
+    mu = np.log(np.array([20., 20.]))
+    value = power_decision.success_value(mu, np.zeros(2), 2., np.array([30., 50.]))
+    np.testing.assert_allclose(value, [10., 0.])
+
+    mu, sigma = power_dens.capacity_params(1., 10., 10., 24.)
+    value = power_decision.success_value(np.array([mu]), np.array([sigma]), 2., 50., capacity_revealed=False)
+    np.testing.assert_allclose(value, 2 * np.exp(mu + sigma**2 / 2) - 50.)
+
+
+def test_alternatives_start_with_decide_now():
+    prospects = pd.DataFrame({'pos': [0.3], 'areaP90': [1.], 'areaP10': [10.], 'pdP90': [10.], 'pdP10': [24.]})
+    alternatives = pd.DataFrame({'cost': [1.], 'sensitivity': [0.8], 'specificity': [0.7]}, index=['MT survey'])
+    decision_df = power_decision.evaluate_alternatives(prospects, alternatives, 2., drilling_cost=10.)
+
+    assert list(decision_df.index.get_level_values('alternative')) == ['decide now', 'MT survey']
@@ -0,0 +1,33 @@
+import warnings
+
+import numpy as np
+import pytest
+
+import power_portfolio
+
+
+@pytest.mark.parametrize('pos, expected', [([0., 0., 0.], 0.), ([1.], 5. * 20.)])
+def test_zero_spread_is_a_point_mass(pos, expected):
+    # no chance of success, or one certain prospect with P90 == P10
+    area = np.full(len(pos), 5.)
+    power_density = np.full(len(pos), 20.)
+    params = power_portfolio.portfolio_params(pos, area, area, power_density, power_density)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        distribution = power_portfolio.portfolio_fft(*params)
+        moments = power_portfolio.portfolio_quantiles(*params, quantiles=[0.1, 0.5, 0.9])
+
+    assert distribution.mean == pytest.approx(expected)
+    np.testing.assert_allclose(distribution.quantile([0.1, 0.5, 0.9]), expected)
+    np.testing.assert_allclose(moments, expected)
+
+
+def test_certain_prospect_without_spread_in_a_portfolio():
+    params = power_portfolio.portfolio_params([1., 0.5], [5., 1.], [5., 10.], [20., 10.], [20., 24.])
+    distribution = power_portfolio.portfolio_fft(*params)
+
+    mean, _, _ = power_portfolio.portfolio_cumulants(*params)
+    assert np.isfinite(distribution.pmf).all()
+    assert distribution.mean == pytest.approx(mean, rel=1e-6)
+    assert distribution.quantile(0.3) >= 100. - 1.
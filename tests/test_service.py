@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+import power_service
+
+
+async def _status(request):
+    """Send one raw request to a fresh service and return the status code of the response"""
+    service = power_service.CapacityService()
+    server = await asyncio.start_server(service.serve_connection, '127.0.0.1', 0)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(request)
+        await writer.drain()
+        status_line = await reader.readline()
+        writer.close()
+        return int(status_line.split()[1])
+    finally:
+        server.close()
+        await server.wait_closed()
+        service.close()
+
+
+@pytest.mark.parametrize('length, status', [('abc', 400), ('-1', 400), (str(power_service.MAX_BODY + 1), 413)])
+def test_invalid_content_length_is_rejected(length, status):
+    request = f'POST /capacity HTTP/1.1\r\nContent-Length: {length}\r\n\r\n'.encode()
+    assert asyncio.run(_status(request)) == status
+
+
+def test_valid_content_length_is_served():
+    body = b'{"areaP90": 1, "areaP10": 10, "pdP90": 10, "pdP10": 24}'
+    request = f'POST /capacity HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode()
+    assert asyncio.run(_status(request + body)) == 200
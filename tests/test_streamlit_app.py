@@ -0,0 +1,37 @@
+import sys
+
+import numpy as np
+
+import power_dens
+import power_fanchart
+import power_scenarios
+from conftest import ROOT
+
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+from bench_capacity import load_streamlit_function
+
+
+def test_app_labels_match_power_dens():
+    app_conf = load_streamlit_function()
+    reference = power_dens.calculate_cumulative_conf(1., 10., 10., 24.)
+
+    for quantiles in (None, np.arange(100) / 100):
+        frame = app_conf(1., 10., 10., 24., quantiles=quantiles)
+        np.testing.assert_array_equal(frame['Cumulative confidence (%)'], reference['Cumulative confidence (%)'])
+        np.testing.assert_array_equal(frame.iloc[:, 1], reference.iloc[:, 1])
+    assert list(frame['Cumulative confidence (%)']) == list(range(100, 0, -1))
+
+
+
+def test_bar_chart_and_scenario_overlay_share_labels():
+    app_conf = load_streamlit_function()
+    scenarios = power_scenarios.ScenarioStore()
+    scenarios.add('base', 1., 10., 10., 24.)
+
+    bar = app_conf(1., 10., 10., 24.)
+    overlay = scenarios.overlay_frame()
+    fan = power_fanchart.fan_chart(np.array([scenarios.curve('base').values]), names=['base'])
+    np.testing.assert_array_equal(overlay['Cumulative confidence (%)'], bar['Cumulative confidence (%)'])
+    np.testing.assert_array_equal(overlay['Expected development size (MWe)'], bar['Expected development size (MWe)'])
+    base = fan[fan['line'] == 'base']
+    np.testing.assert_array_equal(base['Cumulative confidence (%)'], bar['Cumulative confidence (%)'])